@@ -0,0 +1,36 @@
+import asyncio
+
+from fast_logging import LogInit, Indent, DEBUG
+
+
+@Indent()
+def A():
+    logger.info("A()")
+
+
+@Indent()
+def B():
+    logger.info("B()")
+    A()
+
+
+@Indent()
+async def Task(name):
+    logger.info(f"Task {name} started")
+    await asyncio.sleep(0.1)
+    B()
+    logger.info(f"Task {name} finished")
+
+
+async def Main():
+    await asyncio.gather(Task("1"), Task("2"))
+
+
+if __name__ == "__main__":
+    logger = LogInit("root", DEBUG, console=True, indent=(0, 2, 20, True), colors=True)
+    logger.info("Indent by context depth.")
+    A()
+    with Indent():
+        B()
+    asyncio.run(Main())
+    logger.shutdown()
@@ -0,0 +1,30 @@
+import os
+import time
+from threading import Thread
+
+from fast_logging import LogInit
+
+
+def Work(logger, cnt):
+    for i in range(cnt):
+        logger.info("Message %d", i)
+
+
+if __name__ == "__main__":
+    total = 200000
+    pathName = "/tmp/ex_contention_benchmark.log"
+    for threadCnt in (1, 2, 4, 8, 16, 32, 64):
+        if os.path.exists(pathName):
+            os.remove(pathName)
+        logger = LogInit(pathName=pathName)
+        threads = [Thread(target=Work, args=(logger, total // threadCnt)) for _ in range(threadCnt)]
+        t1 = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        dt = time.time() - t1
+        logger.shutdown()
+        with open(pathName, "rb") as F:
+            lines = sum(1 for _ in F)
+        print(f"{threadCnt:2d} threads: {dt:.3f}s  {total / dt:9.0f} messages/s  {lines} lines")
@@ -0,0 +1,31 @@
+import time
+import json
+
+from fast_logging import LogInit, Lazy, DEBUG, INFO
+
+
+def EagerWork(logger, cnt, obj):
+    t1 = time.time()
+    for i in range(cnt):
+        logger.debug("Object %d: %s", i, json.dumps(obj))
+    return time.time() - t1
+
+
+def LazyWork(logger, cnt, obj):
+    t1 = time.time()
+    for i in range(cnt):
+        logger.debug("Object %d: %s", i, Lazy(json.dumps, obj))
+    return time.time() - t1
+
+
+if __name__ == "__main__":
+    cnt = 100000
+    obj = {f"key{i}": list(range(10)) for i in range(20)}
+    pathName = "/tmp/ex_lazy_benchmark.log"
+    for level in (INFO, DEBUG):
+        logger = LogInit(level=level, pathName=pathName if level == DEBUG else None)
+        dtEager = EagerWork(logger, cnt, obj)
+        dtLazy = LazyWork(logger, cnt, obj)
+        logger.shutdown()
+        state = "enabled" if level == DEBUG else "disabled"
+        print(f"debug {state}: eager {dtEager:.3f}s  lazy {dtLazy:.3f}s")
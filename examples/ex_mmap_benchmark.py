@@ -0,0 +1,25 @@
+import os
+import shutil
+import time
+
+from fast_logging import LogInit, FlushPolicy
+
+
+if __name__ == "__main__":
+    cnt = 1000000
+    dirName = "/tmp/ex_mmap_benchmark"
+    for maxBytes in (4096, 65536):
+        for mmapSegment in (0, 4 * 1024 * 1024):
+            if os.path.exists(dirName):
+                shutil.rmtree(dirName)
+            os.makedirs(dirName)
+            logger = LogInit(pathName=os.path.join(dirName, "mmap.log"), maxSize=64 * 1024 * 1024, backupCnt=10)
+            logger.setFlushPolicy(FlushPolicy(maxBytes=maxBytes, mmapSegment=mmapSegment))
+            t1 = time.time()
+            for i in range(cnt):
+                logger.info("Message %d", i)
+            logger.shutdown()
+            dt = time.time() - t1
+            size = sum(os.path.getsize(os.path.join(dirName, fileName)) for fileName in os.listdir(dirName))
+            print(f"maxBytes={maxBytes:5d} mmapSegment={mmapSegment:7d}: {dt:.3f}s  {cnt / dt:9.0f} messages/s  "
+                  f"{size} bytes")
@@ -0,0 +1,27 @@
+import time
+import tracemalloc
+
+from fast_logging import LogRecord, INFO
+
+
+def LegacyEntry(msg, *args, **kwargs):
+    return time.time(), "root", INFO, msg % args, kwargs
+
+
+def Record(msg, *args, exc_info=None, color=None, console=False, extra=None):
+    return LogRecord(time.time(), "root", INFO, msg % args, None, exc_info, color, console, extra)
+
+
+def Measure(func, cnt):
+    tracemalloc.start()
+    entries = [func("Message %d", i) for i in range(cnt)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del entries
+    return size / cnt
+
+
+if __name__ == "__main__":
+    cnt = 100000
+    print(f"(time, domain, level, msg, kwargs) tuples: {Measure(LegacyEntry, cnt):.1f} bytes per record")
+    print(f"LogRecord instances:                      {Measure(Record, cnt):.1f} bytes per record")
@@ -0,0 +1,42 @@
+import os
+import shutil
+import time
+
+from fast_logging import LogInit, RotatePolicy
+
+
+def Work(logger, cnt):
+    latencies = []
+    rotations = []
+    perf_counter = time.perf_counter
+    pos = logger._sink.pos
+    for i in range(cnt):
+        t1 = perf_counter()
+        logger.info("Message %d", i)
+        dt = perf_counter() - t1
+        latencies.append(dt)
+        if logger._sink.pos < pos:
+            # This call rotated the log file.
+            rotations.append(dt)
+        pos = logger._sink.pos
+    return latencies, rotations
+
+
+if __name__ == "__main__":
+    cnt = 200000
+    dirName = "/tmp/ex_rotate_latency_benchmark"
+    for archive in (None, "seq"):
+        for preopen in (False, True):
+            if os.path.exists(dirName):
+                shutil.rmtree(dirName)
+            os.makedirs(dirName)
+            logger = LogInit(pathName=os.path.join(dirName, "rotate.log"), maxSize=256 * 1024, backupCnt=20)
+            logger.setRotatePolicy(RotatePolicy(archive=archive, preopen=preopen))
+            latencies, rotations = Work(logger, cnt)
+            logger.shutdown()
+            latencies.sort()
+            rotations.sort()
+            p50, p99, p999 = [latencies[int(len(latencies) * p)] * 1e6 for p in (0.5, 0.99, 0.999)]
+            print(f"archive={archive!s:4} preopen={preopen!s:5}: all calls p50 {p50:4.1f}us p99 {p99:4.1f}us "
+                  f"p99.9 {p999:5.1f}us | {len(rotations)} rotating calls median "
+                  f"{rotations[len(rotations) // 2] * 1e6:6.1f}us max {rotations[-1] * 1e6:6.1f}us")
@@ -0,0 +1,27 @@
+import time
+import threading
+
+from fast_logging import LogInit, GetLogger, Logger
+
+
+def Work(loggers, cnt):
+    # Alternate runs of repeated messages, so that each run starts and ends a same message timer.
+    t1 = time.time()
+    for i in range(cnt):
+        for logger in loggers:
+            logger.info("Repeated message")
+            logger.info("Repeated message")
+            logger.info(f"Message {i}")
+    return time.time() - t1
+
+
+if __name__ == "__main__":
+    domainCnt = 500
+    cnt = 100
+    Logger.sameMsgCountMax = 1000
+    Logger.sameMsgTimeout = 5.0
+    root = LogInit(pathName="/tmp/ex_same_msg_benchmark.log")
+    loggers = [GetLogger(f"domain{i}") for i in range(domainCnt)]
+    dt = Work(loggers, cnt)
+    print(f"{domainCnt} domains, {domainCnt * cnt * 3} messages: {dt:.3f}s, {threading.active_count()} threads")
+    root.shutdown()
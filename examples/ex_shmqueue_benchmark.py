@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+import multiprocessing
+
+import msgpack
+
+from fast_logging import Logger, LogInit, ShmQueueConsumer
+
+
+def Worker(connect, producer, cnt, results):
+    if producer is not None:
+        Logger.setQueue(producer)
+    logger = LogInit(console=False, connect=connect)
+    t1 = time.time()
+    for i in range(cnt):
+        logger.info("Message %d", i)
+    if connect is not None:
+        logger.flush()
+    # Time the worker spent for handing over its messages.
+    results.put(time.time() - t1)
+    logger.shutdown()
+
+
+def Decode(prefix, message):
+    # The default decoder of LoggingServer expects the raw strings of msgpack < 1.0.
+    logTime, domain, level, msg, kwargs = msgpack.unpackb(message, use_list=False)
+    return logTime, domain, level, prefix + msg, kwargs
+
+
+def CountLines(pathName):
+    with open(pathName, "rb") as F:
+        return sum(chunk.count(b"\n") for chunk in iter(lambda: F.read(1024 * 1024), b""))
+
+
+if __name__ == "__main__":
+    ctx = multiprocessing.get_context("spawn")
+    cnt = 100000
+    results = ctx.Queue()
+    pathName = "/tmp/ex_shmqueue_benchmark.log"
+    for mode in sys.argv[1:] or ("socket", "shmqueue"):
+        for workerCnt in (1, 4):
+            if os.path.exists(pathName):
+                os.remove(pathName)
+            total = workerCnt * cnt
+            if mode == "socket":
+                logger = LogInit(pathName=pathName, server=("127.0.0.1", 12345, 4096, None, None, Decode))
+                consumer = None
+                args = (("127.0.0.1", 12345), None, cnt, results)
+            else:
+                logger = LogInit(pathName=pathName)
+                consumer = ShmQueueConsumer(logger, mpContext=ctx)
+                args = (None, consumer.producer(), cnt, results)
+            workers = [ctx.Process(target=Worker, args=args) for _ in range(workerCnt)]
+            t1 = time.time()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            if consumer is None:
+                # Wait until the server received all messages or no more messages arrive.
+                lines = 0
+                t2 = time.time()
+                while lines < total and time.time() - t2 < 2.0:
+                    time.sleep(0.01)
+                    logger.flush()
+                    lineCnt = CountLines(pathName)
+                    if lineCnt > lines:
+                        lines = lineCnt
+                        t2 = time.time()
+                dt = t2 - t1
+                stats = ""
+            else:
+                stats = consumer.stats()
+                stats = f"  dropped {stats['dropped']} waits {stats['waits']}"
+                consumer.stop()
+                dt = time.time() - t1
+            logger.shutdown()
+            workerDt = max(results.get() for _ in workers)
+            print(f"{mode:8} {workerCnt} workers: {dt:.3f}s  {total / dt:9.0f} messages/s written, "
+                  f"{cnt / workerDt:9.0f} messages/s per worker  {CountLines(pathName)} lines{stats}")
@@ -0,0 +1,33 @@
+import time
+
+from fast_logging import TimeFormatter, Logger
+
+
+def StrftimeWork(timestamps, dateFmt):
+    time_strftime = time.strftime
+    time_localtime = time.localtime
+    t1 = time.time()
+    for logTime in timestamps:
+        time_strftime(dateFmt, time_localtime(logTime))
+    return time.time() - t1
+
+
+def TimeFormatterWork(timestamps, dateFmt):
+    fmtTime = TimeFormatter(dateFmt).format
+    t1 = time.time()
+    for logTime in timestamps:
+        fmtTime(logTime)
+    return time.time() - t1
+
+
+if __name__ == "__main__":
+    cnt = 1000000
+    for msgsPerSec in (1, 100, 10000):
+        t0 = time.time()
+        timestamps = [t0 + i / msgsPerSec for i in range(cnt)]
+        dt1 = StrftimeWork(timestamps, Logger.dateFmt)
+        dt2 = TimeFormatterWork(timestamps, Logger.dateFmt)
+        print(f"{msgsPerSec:6d} messages/s: strftime {dt1:.3f}s  TimeFormatter {dt2:.3f}s  ({dt1 / dt2:.1f}x)")
+    timestamps = [t0 + i / 10000 for i in range(cnt)]
+    dt = TimeFormatterWork(timestamps, "%Y-%m-%d %H:%M:%S.%3f")
+    print(f"TimeFormatter with milliseconds: {dt:.3f}s")
@@ -22,14 +22,25 @@
 
 """Implements lightweight and fast logging."""
 
-from fast_logging.fastlogging import Colors, domains, Logger, GetLogger, LogInit, Remove, Rotate, Shutdown, \
-    CRITICAL, FATAL, ERROR, WARNING, WARN, INFO, DEBUG, NOTSET, EXCEPTION, LOG2SYM, LOG2SSYM, LVL2COL
+from fast_logging.fastlogging import Colors, domains, Logger, GetLogger, LogInit, Remove, Rotate, Shutdown, ParseLevels, \
+    Indent, CRITICAL, FATAL, ERROR, WARNING, WARN, INFO, DEBUG, NOTSET, EXCEPTION, LOG2SYM, LOG2SSYM, LVL2COL
+from fast_logging.formatter import TimeFormatter, Lazy
+from fast_logging.record import LogRecord
+from fast_logging.ratelimit import RateLimiter
+from fast_logging.backlog import Backlog
+from fast_logging.policy import FlushPolicy, RotatePolicy
+from fast_logging.compress import CompressPool
+from fast_logging.mmapwriter import MmapWriter, FindValidEnd
+from fast_logging.flightrec import FlightRecorder, ReadFlightRecorder, InstallDumpHook
+from fast_logging.shmqueue import ShmQueueProducer, ShmQueueConsumer
 from fast_logging.optimize import OptimizeAst, Optimize, OptimizeObj, OptimizeFile, WritePycFile
 
 
-__all__ = ['Colors', 'domains', 'Logger', 'GetLogger', 'LogInit', 'Remove', 'Rotate', 'Shutdown',
+__all__ = ['Colors', 'domains', 'Logger', 'GetLogger', 'LogInit', 'Remove', 'Rotate', 'Shutdown', 'ParseLevels', 'Indent',
            'CRITICAL', 'FATAL', 'ERROR', 'WARNING', 'WARN', 'INFO', 'DEBUG', 'NOTSET',
-           'EXCEPTION', 'LOG2SYM', 'LOG2SSYM', 'LVL2COL',
+           'EXCEPTION', 'LOG2SYM', 'LOG2SSYM', 'LVL2COL', 'TimeFormatter', 'Lazy', 'LogRecord', 'RateLimiter', 'Backlog',
+           'FlushPolicy', 'RotatePolicy', 'CompressPool', 'MmapWriter', 'FindValidEnd',
+           'FlightRecorder', 'ReadFlightRecorder', 'InstallDumpHook', 'ShmQueueProducer', 'ShmQueueConsumer',
            'OptimizeAst', 'Optimize', 'OptimizeObj', 'OptimizeFile', 'WritePycFile']
 
 __author__ = 'Martin Bammer (mrbm74@gmail.com)'
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Martin Bammer. All Rights Reserved.
+# Licensed under MIT license.
+
+"""Queryable in-memory backlog of log records."""
+
+import heapq
+from collections import deque
+from threading import Lock
+
+
+# Estimated memory usage of a record without its message and exc_info.
+RECORD_OVERHEAD = 160
+
+
+class Backlog(object):
+    """Ring buffer of the latest log records, bounded by number of records and/or bytes.
+
+    Besides the records in order of arrival the buffer keeps a deque of records per level and per
+    domain. Because the oldest record is always evicted first, it is also the oldest record of its
+    level and domain deque, so the indexes are updated in O(1) per record. The level indexes hold
+    (sequence number, record) tuples, so they can be merged in order of arrival. The memory usage of
+    a record is estimated by the length of its message and exc_info plus RECORD_OVERHEAD.
+    """
+
+    def __init__(self, maxlen=0, maxBytes=0, records=None):
+        self.maxlen = maxlen
+        self.maxBytes = maxBytes
+        self.size = 0
+        self._records = deque()
+        self._sizes = deque()
+        self._levels = {}    # level -> deque of (sequence number, record)
+        self._domains = {}   # domain -> deque of records
+        self._seq = 0        # Sequence number of the next record
+        self._unordered = 0  # Number of records which are older than their predecessor
+        self._lock = Lock()
+        if records is not None:
+            self.extend(records)
+
+    def __append(self, record):
+        msg = record.msg
+        excInfo = record.exc_info
+        size = (len(msg) if msg.__class__ is str else 0) + (len(excInfo) if excInfo.__class__ is str else 0) + \
+            RECORD_OVERHEAD
+        records = self._records
+        if records and record.time < records[-1].time:
+            self._unordered += 1
+        records.append(record)
+        self._sizes.append(size)
+        self.size += size
+        index = self._levels.get(record.level)
+        if index is None:
+            index = self._levels[record.level] = deque()
+        index.append((self._seq, record))
+        self._seq += 1
+        index = self._domains.get(record.domain)
+        if index is None:
+            index = self._domains[record.domain] = deque()
+        index.append(record)
+
+    def __evict(self):
+        maxlen = self.maxlen
+        maxBytes = self.maxBytes
+        records = self._records
+        while records and ((maxlen and len(records) > maxlen) or (maxBytes and self.size > maxBytes)):
+            record = records.popleft()
+            if records and records[0].time < record.time:
+                self._unordered -= 1
+            self.size -= self._sizes.popleft()
+            self._levels[record.level].popleft()
+            index = self._domains[record.domain]
+            index.popleft()
+            if not index:
+                del self._domains[record.domain]
+
+    def append(self, record):
+        with self._lock:
+            self.__append(record)
+            self.__evict()
+
+    def extend(self, records):
+        with self._lock:
+            for record in records:
+                self.__append(record)
+            self.__evict()
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._sizes.clear()
+            self._levels.clear()
+            self._domains.clear()
+            self.size = 0
+            self._unordered = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(tuple(self._records))
+
+    def __reversed__(self):
+        with self._lock:
+            return reversed(tuple(self._records))
+
+    def domains(self):
+        """Return a dict with the number of records per domain."""
+        with self._lock:
+            return {domain: len(index) for domain, index in self._domains.items()}
+
+    def query(self, level=None, domain=None, since=None, until=None, contains=None, limit=None):
+        """Return the newest matching records in order of arrival.
+
+        level is the minimum level, domain an exact domain name and since/until are a time range.
+        contains is a substring of the message. Records are searched from the newest one. If they
+        arrived in time order, the search stops at the first record older than since.
+        """
+        with self._lock:
+            if domain is not None:
+                candidates = self._domains.get(domain, ())
+                if level is not None:
+                    candidates = [record for record in candidates if record.level >= level]
+                candidates = reversed(candidates)
+            elif level is not None:
+                indexes = [index for indexLevel, index in self._levels.items() if indexLevel >= level]
+                if len(indexes) == 1:
+                    candidates = reversed(indexes[0])
+                else:
+                    candidates = heapq.merge(*[reversed(index) for index in indexes], reverse=True)
+                candidates = (record for _, record in candidates)
+            else:
+                candidates = reversed(self._records)
+            ordered = self._unordered == 0
+            result = []
+            for record in candidates:
+                recordTime = record.time
+                if until is not None and recordTime > until:
+                    continue
+                if since is not None and recordTime < since:
+                    if ordered:
+                        break
+                    continue
+                if contains is not None and contains not in str(record.msg):
+                    continue
+                result.append(record)
+                if limit is not None and len(result) >= limit:
+                    break
+        result.reverse()
+        return result
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Martin Bammer. All Rights Reserved.
+# Licensed under MIT license.
+
+"""Background compression of rotated log files."""
+
+import os
+import sys
+import time
+import traceback
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+
+def StreamCompressor(compressor):
+    """Return a streaming compression object for compressor or None if it only supports compress(data).
+
+    Supported are modules and objects with compressobj (zlib, zstandard.ZstdCompressor) and the
+    modules bz2 and lzma.
+    """
+    if hasattr(compressor, "compressobj"):
+        return compressor.compressobj()
+    for name in ("BZ2Compressor", "LZMACompressor"):
+        if hasattr(compressor, name):
+            return getattr(compressor, name)()
+    return None
+
+
+def CompressFile(compressor, srcPathName, dstPathName, chunkSize=1024 * 1024):
+    """Compress srcPathName in chunks into dstPathName and remove srcPathName.
+
+    The compressed data is written into a temporary file, which is renamed when it is complete.
+    If srcPathName is removed before or while it is compressed (by the retention of archives), no
+    compressed file is kept. Returns the tuple (bytesIn, bytesOut).
+    """
+    stream = StreamCompressor(compressor)
+    tmpPathName = dstPathName + ".tmp"
+    bytesIn = bytesOut = 0
+    try:
+        F = open(srcPathName, "rb")
+    except FileNotFoundError:
+        return bytesIn, bytesOut
+    with F, open(tmpPathName, "wb") as Z:
+        if stream is None:
+            data = F.read()
+            bytesIn = len(data)
+            data = compressor.compress(data)
+            bytesOut = len(data)
+            Z.write(data)
+        else:
+            while True:
+                chunk = F.read(chunkSize)
+                if not chunk:
+                    break
+                bytesIn += len(chunk)
+                data = stream.compress(chunk)
+                if data:
+                    bytesOut += len(data)
+                    Z.write(data)
+            data = stream.flush()
+            bytesOut += len(data)
+            Z.write(data)
+    os.replace(tmpPathName, dstPathName)
+    try:
+        os.remove(srcPathName)
+    except FileNotFoundError:
+        # The retention removes the uncompressed file first. So the compressed file expired too.
+        try:
+            os.remove(dstPathName)
+        except FileNotFoundError:
+            pass
+    return bytesIn, bytesOut
+
+
+class CompressPool(object):
+    """Compress rotated log files with a bounded number of worker threads.
+
+    The compressors of zlib, bz2, lzma and zstandard release the GIL, so threads do not block
+    logging. The optional callback is called after each job with
+    (srcPathName, dstPathName, bytesIn, bytesOut, seconds, error), where error is None or the
+    formatted exception. If a job fails the uncompressed file is kept.
+    """
+
+    def __init__(self, maxWorkers=1, chunkSize=1024 * 1024, callback=None):
+        self.chunkSize = chunkSize
+        self.callback = callback
+        self.executor = ThreadPoolExecutor(maxWorkers, thread_name_prefix="fastlogging-compress")
+        self.lock = Lock()
+        self.pending = 0
+        self.jobs = 0
+        self.errors = 0
+        self.bytesIn = 0
+        self.bytesOut = 0
+        self.seconds = 0.0
+
+    def submit(self, compressor, srcPathName, dstPathName, finish=None):
+        """Queue a compression job. Returns a concurrent.futures.Future.
+
+        The optional finish() is called by the worker after the compression, e.g. to rename the result.
+        """
+        with self.lock:
+            self.pending += 1
+        return self.executor.submit(self.__compress, compressor, srcPathName, dstPathName, finish)
+
+    def __compress(self, compressor, srcPathName, dstPathName, finish):
+        t1 = time.time()
+        bytesIn = bytesOut = 0
+        error = None
+        # noinspection PyBroadException
+        try:
+            bytesIn, bytesOut = CompressFile(compressor, srcPathName, dstPathName, self.chunkSize)
+        except:
+            error = traceback.format_exc()
+            print(error, file=sys.stderr)
+        dt = time.time() - t1
+        with self.lock:
+            self.pending -= 1
+            self.jobs += 1
+            self.errors += error is not None
+            self.bytesIn += bytesIn
+            self.bytesOut += bytesOut
+            self.seconds += dt
+        if finish is not None:
+            # noinspection PyBroadException
+            try:
+                finish()
+            except:
+                print(traceback.format_exc(), file=sys.stderr)
+        if self.callback is not None:
+            self.callback(srcPathName, dstPathName, bytesIn, bytesOut, dt, error)
+
+    def stats(self):
+        with self.lock:
+            return {"pending": self.pending, "jobs": self.jobs, "errors": self.errors, "bytesIn": self.bytesIn,
+                    "bytesOut": self.bytesOut, "seconds": self.seconds}
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait)
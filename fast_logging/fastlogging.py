@@ -7,18 +7,48 @@
 
 import os
 import sys
+import codecs
 import atexit
 import time
 import traceback
-from collections import deque
-from threading import Thread, Timer, Event, Lock
+import functools
+import inspect
+from collections import deque, OrderedDict
+from threading import Thread, Event, Lock, RLock, current_thread
+from concurrent.futures import ThreadPoolExecutor
 
+from fast_logging.formatter import GetTimeFormatter, ParseLayout, CompileLayout, Lazy
+from fast_logging.record import LogRecord
+from fast_logging.backlog import Backlog
+from fast_logging.scheduler import scheduler
+from fast_logging.policy import FlushPolicy, ArchiveIndex, UpdateSymlink
+from fast_logging.compress import CompressPool
+from fast_logging.mmapwriter import MmapWriter
 
-#c cdef time_time, time_strftime, time_localtime, path_join
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Not available on Windows
+
+try:
+    from contextvars import ContextVar
+except ImportError:
+    ContextVar = None  # Python 3.6. Context based indent is not available.
+
+
+#c cdef time_time, path_join, os_write, os_writev, str_isascii
 time_time = time.time
-time_strftime = time.strftime
-time_localtime = time.localtime
 path_join = os.path.join
+os_write = os.write
+os_writev = getattr(os, "writev", None)  # Not available on Windows
+str_isascii = getattr(str, "isascii", None)  # Not available on Python 3.6
+
+
+def WriteAll(fd, data):
+    """Write data to file descriptor fd, continuing after partial writes."""
+    view = memoryview(data)
+    while view:
+        view = view[os_write(fd, view):]
 
 
 def Shutdown(now=True):
@@ -26,7 +56,32 @@ def Shutdown(now=True):
         logger.shutdown(now)
 
 
+_threadLockTypes = (type(Lock()), type(RLock()))
+
+
+def _AfterFork():
+    # The scheduler and the threads start empty in a forked child process (e.g. pre-forked workers).
+    global _rotateExecutor
+    _rotateExecutor = None
+    Logger.compressPool = None
+    if isinstance(Logger.consoleLock, _threadLockTypes):
+        # Could be held by a thread of the parent. Locks of the multiprocessing module are released by the parent.
+        Logger.consoleLock = Lock()
+    if Logger.thrConsoleLogger is not None:
+        import fast_logging.console
+        Logger.thrConsoleLogger = fast_logging.console.ConsoleLogger(Logger.consoleLock)
+        Logger.thrConsoleLogger.start()
+    for sink in _sinks.values():
+        sink._afterFork()
+    for logger in domains.values():
+        if logger is not None:
+            logger._afterFork()
+
+
 atexit.register(Shutdown)
+if hasattr(os, "register_at_fork"):
+    # Registered after the reset of the scheduler, so the callbacks are scheduled on the new heap.
+    os.register_at_fork(after_in_child=_AfterFork)
 
 
 domains = {}  # Dictionary holding all Logger instances for the configured domains
@@ -42,6 +97,9 @@ INFO = 20
 DEBUG = 10
 NOTSET = 0
 
+NAME2LEVEL = {"EXCEPTION": EXCEPTION, "CRITICAL": CRITICAL, "FATAL": FATAL, "ERROR": ERROR, "WARNING": WARNING,
+              "WARN": WARN, "INFO": INFO, "DEBUG": DEBUG, "NOTSET": NOTSET}
+
 LOG2SSYM = {EXCEPTION: "EXC", FATAL: "FAT", ERROR: "ERR", WARNING: "WRN", INFO: "INF", DEBUG: "DBG"}
 
 LOG2SYM = {EXCEPTION: "EXCEPT ", FATAL: "FATAL  ", ERROR: "ERROR  ", WARNING: "WARNING", INFO: "INFO   ",
@@ -93,49 +151,732 @@ except ImportError:
         ORANGE = ""
 
 
+# Argument types which are safe to be formatted later in the writer thread.
+IMMUTABLE_TYPES = frozenset((str, int, float, bool, complex, bytes, type(None)))
+
 LVL2COL = {FATAL: Colors.RED, ERROR: Colors.DARKRED, WARNING: Colors.YELLOW, INFO: Colors.GREEN, DEBUG: Colors.WHITE}
 
 
-def Rotate():
-    signaled = set()
-    for logger in domains.values():
-        if logger.F is None or logger.common.evtRotate in signaled:
+def ParseLevels(spec):
+    """Parse a domain level specification like "app=INFO,app.db=DEBUG" into a dictionary."""
+    levels = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
             continue
-        signaled.add(logger.common.evtRotate)
-        logger.rotate()
+        domain, sep, level = item.partition("=")
+        level = level.strip().upper()
+        if not sep or not domain.strip() or not level:
+            raise ValueError(f"Invalid domain level {item!r}")
+        levels[domain.strip()] = int(level) if level.isdigit() else NAME2LEVEL[level]
+    return levels
+
+
+# Initial log levels of domains. They override the levels provided to GetLogger and LogInit.
+try:
+    envLevels = ParseLevels(os.environ.get("FASTLOGGING_LEVELS", ""))
+except (ValueError, KeyError) as exc:
+    print(f"Warning: Invalid FASTLOGGING_LEVELS: {exc}", file=sys.stderr)
+    envLevels = {}
+
+
+def _LinkDomain(logger):
+    """Insert logger into the domain hierarchy."""
+    domain = logger.domain
+    parentDomain = domain
+    while "." in parentDomain:
+        parentDomain = parentDomain.rsplit(".", 1)[0]
+        parent = domains.get(parentDomain)
+        if parent is not None and parent is not logger:
+            logger.parent = parent
+            parent.children.append(logger)
+            break
+    # Adopt descendants which are now closer to logger than to their current parent.
+    prefix = domain + "."
+    for child in domains.values():
+        if child is None or child is logger or not child.domain.startswith(prefix):
+            continue
+        if child.parent is None or len(child.parent.domain) < len(domain):
+            if child.parent is not None:
+                child.parent.children.remove(child)
+            child.parent = logger
+            logger.children.append(child)
+    logger._updateLevel()
+    logger._updateSink()
+
+
+def _UnlinkDomain(logger):
+    """Remove logger from the domain hierarchy. The children of logger are moved to its parent."""
+    parent = logger.parent
+    if parent is not None:
+        parent.children.remove(logger)
+    for child in logger.children:
+        child.parent = parent
+        if parent is not None:
+            parent.children.append(child)
+        child._updateLevel()
+        child._updateSink()
+    logger.parent = None
+    logger.children = []
+
+
+# Indent depth for loggers with context based indent (see class Indent).
+indentDepth = None if ContextVar is None else ContextVar("fastlogging_indent", default=0)
+
+
+class Indent(object):
+    """Context manager and decorator which increments the indent depth of log messages.
+
+    The depth is stored in a context variable. So it is local to the current thread or asyncio task
+    and determining the depth costs O(1), independent of the call stack depth. Without contextvars
+    (Python 3.6) it does nothing.
+    """
+
+    def __init__(self, inc=1):
+        self.inc = inc
+
+    def __enter__(self):
+        if indentDepth is not None:
+            indentDepth.set(indentDepth.get() + self.inc)
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        if indentDepth is not None:
+            indentDepth.set(indentDepth.get() - self.inc)
+
+    def __call__(self, func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def Wrapper(*args, **kwargs):
+                with self:
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def Wrapper(*args, **kwargs):
+                with self:
+                    return func(*args, **kwargs)
+        return Wrapper
+
+
+def _Disabled(*args, **kwargs):
+    """Shared replacement of the logging methods of disabled levels."""
+    pass
+
+
+# Logging methods with their log levels.
+LEVEL_METHODS = (("debug", DEBUG), ("info", INFO), ("warning", WARNING), ("error", ERROR), ("fatal", FATAL),
+                 ("critical", FATAL), ("exception", EXCEPTION))
+
+
+def Rotate():
+    for sink in tuple(_sinks.values()):
+        sink.rotate()
 
 
 class LastMessage(object):
 
-    def __init__(self, key, cnt, entry):
+    def __init__(self, key, cnt, record):
         self.key = key
         self.cnt = cnt
-        self.entry = entry
+        self.record = record
+
+
+_rotateExecutor = None
+
+
+def _RotateExecutor():
+    # Thread for the file operations after rotations to pre-opened log files.
+    global _rotateExecutor
+    if _rotateExecutor is None:
+        _rotateExecutor = ThreadPoolExecutor(1, thread_name_prefix="fastlogging-rotate")
+    return _rotateExecutor
+
+
+_sinks = {}  # Absolute path name -> FileSink of the open log files
+
+
+def _AcquireSink(pathName, maxSize, backupCnt):
+    # Domains with the same log file share its sink. Further domains pass the same maxSize and
+    # backupCnt as the first one or 0 to use them.
+    key = os.path.abspath(pathName)
+    sink = _sinks.get(key)
+    if sink is None:
+        sink = _sinks[key] = FileSink(pathName, maxSize, backupCnt)
+    elif (maxSize or backupCnt) and (maxSize, backupCnt) != sink.openArgs:
+        raise ValueError(f"{pathName} is already open with maxSize={sink.openArgs[0]} and backupCnt={sink.openArgs[1]}")
+    sink.refCnt += 1
+    return sink
 
 
-class CommonConfig(object):
+class FileSink(object):
+    """Log file, which is shared by all domains with the same path name.
 
-    def __init__(self, queue, evtQueue, evtRotate, maxSize, backupCnt):
-        self.queue = queue
-        self.evtQueue = evtQueue
-        self.evtRotate = evtRotate
+    The domains hold a reference to the sink. It owns the buffers, the write lock, the rotation and
+    flush state and in threaded mode the queue and the writer thread. So the messages of all domains
+    are written and rotated together. The log file is closed when the last domain released it.
+    """
+
+    def __init__(self, pathName, maxSize, backupCnt):
+        self.key = os.path.abspath(pathName)
+        self.pathName = pathName
         self.maxSize = maxSize
         self.backupCnt = backupCnt
+        self.openArgs = (maxSize, backupCnt)  # maxSize and backupCnt of the first domain
+        self.refCnt = 0        # Number of domains which log to this file
+        self.F = None
+        self.buf = []          # Active buffer. Producers append to it without a lock.
+        self._spare = []       # Buffer which is swapped in by the writer
+        self._writeLock = Lock()
+        self._flushPolicy = Logger.flushPolicy
+        self._flushTimer = None   # Scheduler entry which writes the buffered messages after policy.interval
+        self._mmapWriter = None   # MmapWriter if FlushPolicy.mmapSegment is set
+        self._compressJobs = []   # Futures of the compression of rotated log files
+        self._stageCnt = 0        # Counter for the unique names of rotated log files until they are compressed
+        self._archives = None     # ArchiveIndex if the RotatePolicy names archives by sequence number or time
+        self._nextF = None        # Pre-opened next log file, if RotatePolicy.preopen is set
+        self._rotateJob = None    # Future of the renames after a rotation or of pre-opening the next log file
+        self._rotatePolicy = policy = Logger.rotatePolicy
+        if policy is not None and policy.maxSize is not None:
+            self.maxSize = policy.maxSize
+        self._rotateAt = float("inf")  # Time of the next time based rotation
+        self._rotateTimer = None  # Scheduler entry which rotates idle log files on time
+        self._checkPos = 0        # Position at which the size of the log file is checked
+        self._fileId = None       # (st_dev, st_ino) of a shared log file
+        self._lockFd = None       # Lock file which serializes the rotations of a shared log file
+        self.size = 0
+        self.pos = 0
+        # Threaded mode: (logger, record) tuples, which are formatted and written by the writer thread.
+        self.queue = deque()
+        self.evtQueue = Event()
+        self.evtRotate = Event()
+        self._thread = None
+        self.__openFile()
+        if Logger.useThreads:
+            self.__startThread()
+
+    def __startThread(self):
+        self._thread = Thread(target=self.__run, daemon=True, name=f"LogThread_{os.path.basename(self.pathName)}")
+        self._thread.start()
+
+    def _afterFork(self):
+        # Called in a forked child process. The buffered messages are written by the parent. Locks
+        # could be held by threads, which don't exist in the child.
+        self.buf = []
+        self._spare = []
+        self.size = 0
+        self.queue.clear()
+        self._writeLock = Lock()
+        self._flushTimer = None
+        self._rotateJob = None
+        self._compressJobs = []
+        if self._lockFd is not None:
+            # A flock belongs to the open file description, which is shared with the parent.
+            os.close(self._lockFd)
+            self._lockFd = None
+        if self._rotateTimer is not None:
+            self._rotateTimer = scheduler.schedule(max(0.0, self._rotateAt - time_time()), self.__rotateTimeout)
+        if self._thread is not None:
+            self.evtQueue = Event()
+            self.evtRotate = Event()
+            self.__startThread()
+
+    def release(self, now=False):
+        # Called by Logger.stop. The last domain closes the log file.
+        self.refCnt -= 1
+        if self.refCnt > 0:
+            if self._thread is None and self.F is not None:
+                self.writePending()
+            return
+        if _sinks.get(self.key) is self:
+            del _sinks[self.key]
+        if self._thread is None and self.F is not None:
+            with self._writeLock:
+                if Logger.cbWriter is None:
+                    self.__writeBuffers()
+                elif self.buf:
+                    Logger.cbWriter(self)
+                self.__closeFile()
+        if self._rotateTimer is not None:
+            scheduler.cancel(self._rotateTimer)
+            self._rotateTimer = None
+        if self._thread is not None:
+            if now:
+                self.queue.clear()
+            self.queue.append(None)
+            self.evtQueue.set()
+
+    def join(self):
+        if self.refCnt > 0:
+            return
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for job in self._compressJobs:
+            job.result()
+        self._compressJobs = []
+
+    def flush(self):
+        if self._thread is None and self.F is not None:
+            self.writePending()
+
+    def setRotatePolicy(self, policy):
+        self._rotatePolicy = policy
+        if policy is not None and policy.maxSize is not None:
+            self.maxSize = policy.maxSize
+        if self.F is not None:
+            self.__initFile()
+            self.__preopen()
+
+    def setFlushPolicy(self, policy):
+        self._flushPolicy = policy
+        if self.F is not None and (self._mmapWriter is None) != (policy.mmapSegment == 0):
+            with self._writeLock:
+                self.__writeBuffers()
+                self.__closeWriter()
+                self.__attachWriter()
+
+    def rotate(self, bWait=False):
+        if self.F is None:
+            return
+        if self._thread is not None:
+            self.evtRotate.set()
+            self.evtQueue.set()
+            if bWait:
+                while self.evtQueue.is_set():
+                    time.sleep(0.01)
+        else:
+            self.__rotate()
+
+    def __flushTimeout(self):
+        self._flushTimer = None
+        if self.F is not None:
+            self.writePending()
+
+    def __rotate(self, check=False):
+        with self._writeLock:
+            shared = self._rotatePolicy is not None and self._rotatePolicy.shared
+            if shared:
+                # Count the messages of the other processes and follow their rotations.
+                self.__writeBuffers()
+                st = self.__statFile()
+                if st is None:
+                    self.F.close()
+                    self.__openFile()
+                else:
+                    self.pos = st.st_size
+                    self.__setCheckPos()
+            if check and (self.maxSize == 0 or self.pos < self.maxSize) and \
+                    time_time() < self._rotateAt:
+                # Another thread or process rotated the log file in the meantime.
+                return
+            self.__writeBuffers()
+            if shared:
+                self.__rotateShared()
+            else:
+                self.__doRotate()
+        # Write messages which were buffered during the rotation.
+        self.writePending()
+
+    def __doRotate(self):
+        if self._rotatePolicy is not None and self._rotatePolicy.preopen:
+            if self._rotateJob is not None:
+                # Only if the log file is rotated again before the last renames are done.
+                self._rotateJob.result()
+                self._rotateJob = None
+            if self._nextF is not None:
+                # Swap to the pre-opened next log file. Everything else is done by the rotate thread.
+                F = self.F
+                writer = self._mmapWriter
+                self.F = self._nextF
+                self._nextF = None
+                self.__attachWriter()
+                self.__initFile()
+                self._rotateJob = _RotateExecutor().submit(self.__finishRotation, F, writer)
+                return
+        self.__closeWriter()
+        self.F.flush()
+        self.F.close()
+        self.__renameLogFile()
+        self.__openFile()
+
+    def __rotateShared(self):
+        # The rotations of a shared log file are serialized with a lock file. If another process
+        # rotated the log file in the meantime it is only reopened.
+        if self._lockFd is None:
+            self._lockFd = os.open(self.pathName + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._lockFd, fcntl.LOCK_EX)
+        try:
+            self.F.close()
+            if self.__statFile() is not None:
+                # The other processes also add archives, so the index is created again.
+                self._archives = None
+                self.__renameLogFile()
+            self.__openFile()
+        finally:
+            fcntl.flock(self._lockFd, fcntl.LOCK_UN)
+
+    def __statFile(self):
+        # Returns the stat result of a shared log file or None if it was rotated by another process.
+        try:
+            st = os.stat(self.pathName)
+        except FileNotFoundError:
+            return None
+        return st if (st.st_dev, st.st_ino) == self._fileId else None
+
+    def __finishRotation(self, F, writer):
+        # Called by the rotate thread after a rotation to the pre-opened next log file.
+        if writer is not None:
+            writer.close()
+        F.close()
+        self.__renameLogFile()
+        os.replace(self.pathName + ".next", self.pathName)
+        self.__openNextFile()
+
+    def __openNextFile(self):
+        nextPathName = self.pathName + ".next"
+        if os.path.exists(nextPathName) and os.path.getsize(nextPathName) > 0:
+            # Left over by a crashed process. Its messages are rotated like a log file.
+            if self._rotatePolicy.archive is not None:
+                self.__archive(nextPathName, "" if Logger.compress is None else Logger.compress[1])
+            else:
+                self.__shiftBackups(nextPathName, "")
+        self._nextF = open(nextPathName, "a+b", buffering=0)
+
+    def __closeFile(self):
+        self.__closeWriter()
+        self.F.flush()
+        self.F.close()
+        self.F = None
+        if self._rotateJob is not None:
+            self._rotateJob.result()
+            self._rotateJob = None
+        if self._nextF is not None:
+            self._nextF.close()
+            self._nextF = None
+            nextPathName = self.pathName + ".next"
+            if os.path.getsize(nextPathName) == 0:
+                os.remove(nextPathName)
+        if self._lockFd is not None:
+            os.close(self._lockFd)
+            self._lockFd = None
+
+    def __renameLogFile(self):
+        pathName = self.pathName
+        zExt = "" if Logger.compress is None else Logger.compress[1]
+        if self._rotatePolicy is not None and self._rotatePolicy.archive is not None:
+            self.__archive(pathName, zExt)
+            return
+        if Logger.compress is None:
+            self.__shiftBackups(pathName, "")
+            return
+        # Rename instantly to a unique name and compress in the background. The backups are shifted by
+        # the compress pool after the compression, so the rotation never waits for it.
+        self._stageCnt += 1
+        stagePathName = f"{pathName}.{os.getpid()}-{self._stageCnt}.rotated"
+        os.replace(pathName, stagePathName)
+        if Logger.compressPool is None:
+            Logger.compressPool = CompressPool()
+        prevJob = self._compressJobs[-1] if self._compressJobs else None
+        self._compressJobs = [job for job in self._compressJobs if not job.done()]
+        self._compressJobs.append(Logger.compressPool.submit(
+            Logger.compress[0], stagePathName, stagePathName + zExt,
+            functools.partial(self.__finishCompression, stagePathName, zExt, prevJob)))
+
+    def __finishCompression(self, stagePathName, zExt, prevJob):
+        # Called by the compress pool. The backups are shifted in the order of the rotations.
+        if prevJob is not None:
+            prevJob.result()
+        if not os.path.exists(stagePathName + zExt):
+            zExt = ""  # The compression failed. The uncompressed file is kept.
+        if self._rotatePolicy is None or not self._rotatePolicy.shared:
+            self.__shiftBackups(stagePathName + zExt, zExt)
+            return
+        # Serialized with the rotations of the other processes. The own lock file descriptor can't be
+        # used, because a flock is shared by all threads of a process.
+        lockFd = os.open(self.pathName + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lockFd, fcntl.LOCK_EX)
+            self.__shiftBackups(stagePathName + zExt, zExt)
+        finally:
+            os.close(lockFd)
+
+    def __shiftBackups(self, srcPathName, zExt):
+        # Renames the backups log.N to log.N+1 and srcPathName to log.1.
+        dirName, logFileName = os.path.split(self.pathName)
+        fileNames = {fileName for fileName in os.listdir(dirName if dirName else ".")
+                     if fileName.startswith(logFileName)}
+        # noinspection PyBroadException
+        try:
+            for cnt in range(self.backupCnt, 1, -1):
+                srcFileName = f"{logFileName}.{cnt - 1}{zExt}"
+                if srcFileName not in fileNames:
+                    continue
+                os.replace(path_join(dirName, srcFileName), path_join(dirName, f"{logFileName}.{cnt}{zExt}"))
+        except:
+            pass
+        os.replace(srcPathName, path_join(dirName, f"{logFileName}.1{zExt}"))
+
+    def __archive(self, srcPathName, zExt):
+        # Rotation with a single rename. The retention removes the oldest archives of the index.
+        if self._archives is None:
+            self._archives = ArchiveIndex(self.pathName, self._rotatePolicy.archive, zExt, self._rotatePolicy.utc)
+        archivePathName = self._archives.next(time_time())
+        os.replace(srcPathName, archivePathName)
+        if Logger.compress is not None:
+            if Logger.compressPool is None:
+                Logger.compressPool = CompressPool()
+            self._compressJobs = [job for job in self._compressJobs if not job.done()]
+            self._compressJobs.append(Logger.compressPool.submit(Logger.compress[0], archivePathName,
+                                                                 archivePathName + zExt))
+            archivePathName += zExt
+        for expiredPathName in self._archives.add(archivePathName, self.backupCnt):
+            expiredPathNames = [expiredPathName]
+            if zExt and expiredPathName.endswith(zExt):
+                # The archive could still be compressed. Removing the uncompressed file first makes the
+                # compression skip it or remove its result (see CompressFile).
+                expiredPathNames.insert(0, expiredPathName[:-len(zExt)])
+            for expiredPathName in expiredPathNames:
+                try:
+                    os.remove(expiredPathName)
+                except FileNotFoundError:
+                    pass
+
+    def writePending(self):
+        if Logger.cbWriter is not None:
+            if self.buf:
+                Logger.cbWriter(self)
+            return
+        # If another thread is writing it also writes our messages, because the buffers are checked
+        # again after the write lock was released.
+        writeLock = self._writeLock
+        while (self.buf or self._spare) and writeLock.acquire(False):
+            try:
+                self.__writeBuffers()
+            finally:
+                writeLock.release()
+
+    def __openFile(self):
+        # Log files are written unbuffered in binary mode. The messages are encoded once per batch.
+        # They are opened for reading too, because a MmapWriter needs a shared writable mapping.
+        self.F = open(self.pathName, "a+b", buffering=0)
+        self.__attachWriter()
+        self.__initFile()
+        self.__preopen()
+
+    def __attachWriter(self):
+        if self._flushPolicy.mmapSegment > 0:
+            if self._rotatePolicy is not None and self._rotatePolicy.shared:
+                raise ValueError("mmapSegment is not supported for shared log files")
+            self._mmapWriter = MmapWriter(self.F.fileno(), self._flushPolicy.mmapSegment)
+
+    def __closeWriter(self):
+        # Truncates the log file to the length of the written messages.
+        if self._mmapWriter is not None:
+            self._mmapWriter.close()
+            self._mmapWriter = None
+
+    def __preopen(self):
+        if self._rotatePolicy is not None and self._rotatePolicy.preopen and self._nextF is None and \
+                self._rotateJob is None:
+            self._rotateJob = _RotateExecutor().submit(self.__openNextFile)
+
+    def __initFile(self):
+        encoding = Logger.encoding or "utf-8"
+        self.pos = self.F.tell() if self._mmapWriter is None else self._mmapWriter.pos
+        self._encoding = encoding
+        self._encode = codecs.getincrementalencoder(encoding)("backslashreplace").encode
+        # If the encoding is ASCII compatible the size of ASCII messages in bytes is their length.
+        self._asciiBytes = "\n".encode(encoding) == b"\n"
+        # Without str.isascii (Python 3.6) the size of each message is computed by encoding it.
+        self._asciiLen = self._asciiBytes and str_isascii is not None
+        if self._rotatePolicy is not None and self._rotatePolicy.shared:
+            st = os.fstat(self.F.fileno())
+            self._fileId = (st.st_dev, st.st_ino)
+            self.pos = st.st_size
+        self.__setCheckPos()
+        self.__scheduleRotation()
+
+    def __setCheckPos(self):
+        # Shared log files are also written by other processes. So their size is checked in steps of
+        # checkBytes instead of rotating at maxSize.
+        maxSize = self.maxSize
+        policy = self._rotatePolicy
+        if policy is not None and policy.shared and maxSize > 0:
+            self._checkPos = min(maxSize, self.pos + policy.checkBytes)
+        else:
+            self._checkPos = maxSize
+
+    def __scheduleRotation(self):
+        # The next rotation time is computed once, so each message only needs one comparison.
+        if self._rotateTimer is not None:
+            scheduler.cancel(self._rotateTimer)
+            self._rotateTimer = None
+        policy = self._rotatePolicy
+        if policy is None:
+            self._rotateAt = float("inf")
+            return
+        if policy.symlink:
+            UpdateSymlink(policy.symlink, os.path.abspath(self.pathName))
+        now = time_time()
+        self._rotateAt = policy.nextRotation(now)
+        if self._rotateAt != float("inf"):
+            self._rotateTimer = scheduler.schedule(self._rotateAt - now, self.__rotateTimeout)
+
+    def __rotateTimeout(self):
+        # Called by the shared scheduler, so that idle log files are also rotated on time.
+        self._rotateTimer = None
+        if self.F is None or self.refCnt == 0:
+            return
+        if time_time() < self._rotateAt:
+            self._rotateTimer = scheduler.schedule(self._rotateAt - time_time(), self.__rotateTimeout)
+        elif self.pos == 0 and not self.buf and \
+                (self.F.tell() if self._mmapWriter is None else self._mmapWriter.pos) == 0:
+            # Don't rotate empty log files.
+            self.__scheduleRotation()
+        else:
+            self.rotate()
+
+    def __writeMessages(self, messages):
+        # Write the messages with a single system call. The line separator after the last message is
+        # written with os.writev, so no copy of the batch is needed to append it.
+        data = "\n".join(messages)
+        if self._mmapWriter is not None:
+            # Copy into the memory mapping. System calls are only needed once per segment.
+            self._mmapWriter.write(self._encode(data + "\n"))
+            return
+        fd = self.F.fileno()
+        if os_writev is None or not self._asciiBytes:
+            WriteAll(fd, self._encode(data + "\n"))
+            return
+        data = self._encode(data)
+        written = os_writev(fd, (data, b"\n"))
+        if written <= len(data):
+            # Partial write
+            if written < len(data):
+                WriteAll(fd, memoryview(data)[written:])
+            WriteAll(fd, b"\n")
+
+    def __writeBuffers(self):
+        # Swap the buffers in O(1) and write outside of any lock. A producer, which fetched the
+        # active buffer before the swap, could still append to it. So only the joined messages are
+        # removed and such late messages are written first with the next swap.
+        spare = self._spare
+        cnt = len(spare)
+        if cnt:
+            messages = spare[:cnt]
+            del spare[:cnt]
+            self.__writeMessages(messages)
+        buf = self.buf
+        self.buf = spare
+        self._spare = buf
+        self.size = 0
+        written = cnt
+        cnt = len(buf)
+        if cnt:
+            messages = buf[:cnt]
+            del buf[:cnt]
+            self.__writeMessages(messages)
+            written += cnt
+        if written and self._flushPolicy.syncFile is not None:
+            self._flushPolicy.syncFile(self.F.fileno())
+
+    def append(self, record, data, level):
+        # data is one or more messages without the line separator after the last message. record is
+        # the latest record of them and level their highest level.
+        # noinspection PyBroadException
+        try:
+            if self.F is not None:
+                size = len(data) + 1
+                # list.append is atomic, so no lock is needed. size is only a threshold for writing.
+                self.buf.append(data)
+                self.size += size
+                if self.maxSize > 0:
+                    if not (self._asciiLen and data.isascii()):
+                        # The position is tracked in bytes. isascii is O(1), so only non ASCII
+                        # messages are encoded twice.
+                        size = len((data + "\n").encode(self._encoding, "backslashreplace"))
+                    self.pos += size
+                    if self.pos >= self._checkPos:
+                        self.__rotate(True)
+                        return
+                if record.time >= self._rotateAt:
+                    self.__rotate(True)
+                    return
+                policy = self._flushPolicy
+                if self.size >= policy.maxBytes or (policy.level is not None and level >= policy.level):
+                    self.writePending()
+                elif policy.interval is not None and self._flushTimer is None:
+                    self._flushTimer = scheduler.schedule(policy.interval, self.__flushTimeout)
+        except:
+            errMsg = traceback.format_exc()
+            if Logger.backlog is not None:
+                Logger.backlog.append(LogRecord(record.time, record.domain, FATAL, errMsg))
+            print(f"{Colors.RED}{errMsg}{Colors.RESETALL}", file=Logger.stderr)
+
+    def __run(self):
+        queue_popleft = self.queue.popleft
+        evtQueue = self.evtQueue
+        evtRotate = self.evtRotate
+        while True:
+            try:
+                item = queue_popleft()
+                if item is None:
+                    if self.F is not None:
+                        if self.buf:
+                            self.writePending()
+                        self.__closeFile()
+                    break
+            except IndexError:
+                if self.F is not None and self.buf:
+                    self.writePending()
+                evtQueue.wait()
+                evtQueue.clear()
+                if evtRotate.is_set():
+                    self.__rotate()
+                    evtRotate.clear()
+                continue
+            logger, record = item
+            # noinspection PyBroadException
+            try:
+                logger._writeRecord(record)
+            except:
+                errMsg = traceback.format_exc()
+                if Logger.backlog is not None:
+                    if record.__class__ is list:
+                        record = record[0]
+                    Logger.backlog.append(LogRecord(record.time, record.domain, FATAL, errMsg))
+                print(f"{Colors.RED}{errMsg}{Colors.RESETALL}", file=Logger.stderr)
+
+
+def _Extra(extra, kwargs):
+    # Other keyword arguments of the logging methods are added to extra, like in LogRecord.fromKwargs.
+    return kwargs if extra is None else {**extra, **kwargs}
 
 
 class Logger(object):
 
     backlog = None
-    dateFmt = "%y.%m.%d %H:%M:%S"
+    flushPolicy = FlushPolicy()  # Default flush policy of log files
+    rotatePolicy = None    # Default RotatePolicy of log files (None = rotate only by maxSize)
+    flightRecorder = None  # FlightRecorder instance, which also records messages of disabled levels
+    queue = None           # ShmQueueProducer, which forwards all records to a writer process
+    dateFmt = "%y.%m.%d %H:%M:%S"  # Default date format. Supports %f (microseconds) and %3f (milliseconds)
+    utc = False            # Default for logging times in UTC (True) or local time (False)
+    layout = "{time}: {domain}: {level}: {message}"  # Default layout of log messages
     cbMessageKey = None    # Custom log messages key calculation callback function
     cbFormatter = None     # Custom log messages formatter callback function
     cbWriter = None        # Custom log messages writer callback function
     colors = False         # Enable/Disable colored logging to console
     compress = None        # (CompressorInstance, CompressedFileExtension)
+    compressPool = None    # CompressPool for compressing rotated log files (created on first use)
     useThreads = False     # Write log messages in main thread (False) or in background thread (True)
+    deferFormat = None     # Format messages in the writer thread: None (never), "immutable" or "all"
+    lazyCallables = False  # Treat callable log message arguments as lazy arguments (see class Lazy)
     encoding = None        # Encoding to use for log files
     sameMsgTimeout = 30.0  # Timeout for same log messages in a row
     sameMsgCountMax = 0    # Maximum counter value for same log messages in a row
+    dedupWindow = 0.0      # Time window for counting same log messages which are not in a row (0 = disabled)
+    dedupMaxKeys = 1024    # Maximum number of message keys in the dedup window
     thrConsoleLogger = None  # Console logger thread instance.
     console = False        # Default console setting
     indent = None          # Message indent settings (offset, inc, max)
@@ -147,35 +888,31 @@ class Logger(object):
         if (maxSize < 0) or (backupCnt < 0) or ((maxSize > 0) and (backupCnt == 0)):
             raise ValueError("Invalid maxSize or backupCnt")
         self.domain = domain
+        self.parent = None     # Parent logger in the domain hierarchy
+        self.children = []     # Child loggers in the domain hierarchy
         self.level = level
-        self.common = CommonConfig(deque(), Event(), Event(), maxSize, backupCnt)
+        self._fmtTime = GetTimeFormatter(Logger.dateFmt, Logger.utc).format
+        self.setLayout(Logger.layout)
         self._lastMsg = LastMessage(None, 1, None)
         self.pathName = pathName
-        self.F = None
-        self.lock = Lock()
-        self.buf = []
-        self.size = 0
-        self.pos = 0
+        self._fileSink = None if pathName is None else _AcquireSink(pathName, maxSize, backupCnt)
+        self._sink = self._fileSink  # FileSink this domain writes to (own or of the nearest ancestor)
         self._console = console
         self._indent_offset = 0 if indent is None else indent[0]
         self._indent_inc = 0 if indent is None else indent[1]
         self._indent_max = 0 if indent is None else indent[2]
-        self._thrTimer = None
-        self._thrLogger = None
+        # Optional 4th indent setting: Use depth of Indent context instead of call stack depth.
+        # Ignored without contextvars (Python 3.6).
+        self._indent_ctx = self._indent_inc > 0 and len(indent) > 3 and bool(indent[3]) and indentDepth is not None
+        self._indent_frames = self._indent_inc > 0 and not self._indent_ctx
+        self._lastMsgTimer = None   # Scheduler entry which flushes the current run of same messages
+        self._lastMsgLock = Lock()
+        self._limiter = None   # Optional RateLimiter instance
+        self._limiterTimer = None  # Scheduler entry which reports the suppressed messages
+        self._dedup = OrderedDict()  # key -> [firstTime, cnt, level, msg, args] in order of first occurrence
+        self._dedupLock = Lock()
+        self._dedupTimer = None
         self.stopped = False
-        if pathName is not None:
-            for logger in domains.values():
-                if pathName == logger.pathName:
-                    common = logger.common
-                    self.common = CommonConfig(common.queue, common.evtQueue, common.evtRotate,
-                                               common.maxSize, common.backupCnt)
-                    break
-            else:
-                self.F = open(pathName, "a", encoding=Logger.encoding)
-                self.pos = self.F.tell()
-                if Logger.useThreads:
-                    self._thrLogger = Thread(target=self.__logThread, daemon=True, name=f"LogThread_{domain}")
-                    self._thrLogger.start()
         if Logger.useThreads and Logger.thrConsoleLogger is None:
             import fast_logging.console
             Logger.thrConsoleLogger = fast_logging.console.ConsoleLogger(Logger.consoleLock)
@@ -192,6 +929,19 @@ class Logger(object):
     def __del__(self):
         self.stopNetwork()
 
+    def _afterFork(self):
+        # Called in a forked child process. Pending runs, duplicates and suppressed messages are
+        # reported by the parent.
+        self._lastMsg = LastMessage(None, 1, None)
+        self._lastMsgTimer = None
+        self._lastMsgLock = Lock()
+        self._dedup.clear()
+        self._dedupTimer = None
+        self._dedupLock = Lock()
+        self._limiterTimer = None
+        if self._limiter is not None:
+            self._limiter.report()
+
     def stopNetwork(self):
         if hasattr(self, "server"):
             self.server.stop()
@@ -202,96 +952,360 @@ class Logger(object):
             self.client.join()
             del self.client
 
+    @property
+    def level(self):
+        return self._level
+
+    @level.setter
+    def level(self, level):
+        self.setLevel(level)
+
     def setLevel(self, level):
-        self.level = level
+        self._levelCfg = level
+        self._updateLevel()
+
+    def _updateLevel(self):
+        # The effective level is computed once. Domains with level NOTSET inherit the level of their parent.
+        level = self._levelCfg
+        if level == NOTSET and self.parent is not None:
+            level = self.parent._level
+        self._level = level
+        # Replace the methods of disabled levels by a no-op function. So disabled calls don't need to
+        # check the level and the methods of enabled levels are found in the class.
+        instDict = self.__dict__
+        recorder = Logger.flightRecorder
+        for name, methodLevel in LEVEL_METHODS:
+            if level > methodLevel:
+                if recorder is None or methodLevel < recorder.level:
+                    instDict[name] = _Disabled
+                else:
+                    instDict[name] = functools.partial(self._recordOnly, methodLevel)
+            else:
+                instDict.pop(name, None)
+        self.debugEnabled = level <= DEBUG
+        self.infoEnabled = level <= INFO
+        self.warningEnabled = level <= WARNING
+        self.errorEnabled = level <= ERROR
+        self.fatalEnabled = level <= FATAL
+        for child in self.children:
+            if child._levelCfg == NOTSET:
+                child._updateLevel()
+
+    def _updateSink(self):
+        # Domains without an own log file write to the log file of their nearest ancestor.
+        if self._fileSink is None and self.parent is not None:
+            self._sink = self.parent._sink
+        else:
+            self._sink = self._fileSink
+        for child in self.children:
+            child._updateSink()
+
+    def _recordOnly(self, level, msg, *args, exc_info=None, **kwargs):
+        # Replacement of the logging methods of disabled levels if a flight recorder is set.
+        recorder = Logger.flightRecorder
+        if recorder is not None:
+            if args:
+                msg = msg % args
+            if exc_info:
+                msg = f"{msg}\n{exc_info}"
+            recorder.write(time_time(), self.domain, level, msg)
+
+    @staticmethod
+    def setQueue(producer):
+        # Forward the records of all loggers of this process to the ShmQueueConsumer of producer.
+        if Logger.queue is not None and Logger.queue is not producer:
+            Logger.queue.close()
+        Logger.queue = producer
+
+    @staticmethod
+    def setFlightRecorder(recorder):
+        Logger.flightRecorder = recorder
+        # Domains with an own level are not updated by the recursion of their parent.
+        for logger in domains.values():
+            if logger is not None:
+                logger._updateLevel()
+
+    def isEnabledFor(self, level):
+        return level >= self._level
+
+    def setDateFmt(self, dateFmt=None, utc=None):
+        self._fmtTime = GetTimeFormatter(Logger.dateFmt if dateFmt is None else dateFmt,
+                                         Logger.utc if utc is None else utc).format
+        self._layouts = {}
+
+    def setLayout(self, layout=None):
+        if layout is None:
+            layout = Logger.layout
+        fieldNames = {fieldName for fieldName, _, _ in ParseLayout(layout)}
+        self._layout = layout
+        self._layouts = {}  # Compiled layouts per domain
+        self._captureThread = "thread" in fieldNames
+        self._captureCaller = "caller" in fieldNames
+        self._capture = self._captureThread or self._captureCaller
 
     def setConsole(self, console):
         self._console = console
 
     @staticmethod
-    def setBacklog(size):
-        if size > 0:
-            if Logger.backlog is None:
-                Logger.backlog = deque(maxlen=size)
-            else:
-                Logger.backlog = deque(Logger.backlog, maxlen=size)
+    def setBacklog(size, maxBytes=0):
+        if size > 0 or maxBytes > 0:
+            Logger.backlog = Backlog(size, maxBytes, Logger.backlog)
         else:
             Logger.backlog = None
 
-    def __log(self, level, msg, args, kwargs, domain=None, log_time=None):
+    def __log(self, level, msg, args, exc_info=None, color=None, console=False, extra=None,
+              domain=None, log_time=None):
         if self.stopped:
             raise RuntimeError("Logger already stopped")
-        if args:
-            msg = msg % args
-        if domain is None:
-            domain = self.domain
         if log_time is None:
             log_time = time_time()
-        if Logger.useThreads or self._thrLogger is not None:
-            self.common.queue.append((log_time, domain, level, msg, kwargs))
-            self.common.evtQueue.set()
-        elif Logger.sameMsgCountMax > 0:
-            self.__logEntry((log_time, domain, level, msg, kwargs))
+        limiter = self._limiter
+        if limiter is not None:
+            # The rate limit is checked before any formatting is done.
+            if limiter.byCallsite:
+                # noinspection PyProtectedMember
+                frame = sys._getframe(2)
+                key = (frame.f_code, frame.f_lineno)
+            else:
+                key = msg
+            if log_time >= limiter.nextReport:
+                self.__reportSuppressed()
+            if not limiter.allow(key, level, msg, log_time):
+                if self._limiterTimer is None:
+                    self._limiterTimer = scheduler.schedule(max(0.0, limiter.nextReport - log_time),
+                                                            self.__reportTimeout)
+                return
+        if Logger.dedupWindow > 0.0:
+            if Logger.cbMessageKey is None:
+                key = (level, msg)
+            else:
+                key = Logger.cbMessageKey(self, LogRecord(log_time, domain or self.domain, level, msg, args or None,
+                                                          exc_info, color, console, extra))
+            if self.__dedupEntry(key, level, msg, args, log_time):
+                return
+        if self._indent_ctx:
+            # Indent is applied in the calling thread, so it is also correct when formatting is done
+            # in the writer thread.
+            depth = indentDepth.get() - self._indent_offset
+            if depth > 0:
+                msg = " " * min(depth * self._indent_inc, self._indent_max) + msg
+        if domain is None:
+            domain = self.domain
+        if args and Logger.lazyCallables:
+            args = tuple([Lazy(arg) if callable(arg) else arg for arg in args])
+        if Logger.queue is not None:
+            # The record is formatted and written by the writer process.
+            Logger.queue.put(log_time, domain, level, msg % args if args else msg, exc_info)
+            return
+        sink = self._sink
+        if sink is not None and sink._thread is not None:
+            if args:
+                deferFormat = Logger.deferFormat
+                if deferFormat is None or (deferFormat != "all" and not IMMUTABLE_TYPES.issuperset(map(type, args))):
+                    # Mutable arguments are only formatted in the writer thread if explicitly configured,
+                    # because they could change before the message is formatted.
+                    msg = msg % args
+                    args = None
+            record = LogRecord(log_time, domain, level, msg, args, exc_info, color, console, extra)
+            if self._capture:
+                self.__capture(record)
+            if Logger.flightRecorder is not None:
+                Logger.flightRecorder.record(record)
+            sink.queue.append((self, record))
+            sink.evtQueue.set()
+            return
+        if args:
+            msg = msg % args
+        record = LogRecord(log_time, domain, level, msg, None, exc_info, color, console, extra)
+        if self._capture:
+            self.__capture(record)
+        if Logger.flightRecorder is not None:
+            Logger.flightRecorder.record(record)
+        if Logger.sameMsgCountMax > 0:
+            self.__logEntry(record)
+        else:
+            self._logMessage(None, record, 0)
+
+    def setRateLimit(self, limiter):
+        if self._limiter is not None:
+            self.__reportSuppressed()
+        self._limiter = limiter
+
+    def __reportTimeout(self):
+        # Called by the shared scheduler, so that suppressed messages are reported every reportInterval
+        # seconds, even if the logger is idle.
+        self._limiterTimer = None
+        if self._limiter is None or self.stopped or self._limiter.nextReport == float("inf"):
+            return
+        delay = self._limiter.nextReport - time_time()
+        if delay > 0.0:
+            self._limiterTimer = scheduler.schedule(delay, self.__reportTimeout)
         else:
-            self._logMessage(None, (log_time, domain, level, msg, kwargs), 0)
+            self.__reportSuppressed()
+
+    def __reportSuppressed(self):
+        if self._limiterTimer is not None:
+            scheduler.cancel(self._limiterTimer)
+            self._limiterTimer = None
+        self.logMany([(level, "Suppressed %d messages like: %s", (suppressed, msg))
+                      for level, msg, suppressed in self._limiter.report()])
+
+    def __dedupEntry(self, key, level, msg, args, log_time):
+        # Return True if the message is a duplicate within the dedup window. Entries are kept in order
+        # of their first occurrence, so expired and evicted entries are always taken from the front.
+        dedup = self._dedup
+        window = Logger.dedupWindow
+        summaries = []
+        with self._dedupLock:
+            while dedup:
+                entry = next(iter(dedup.values()))
+                if entry[0] + window > log_time:
+                    break
+                dedup.popitem(last=False)
+                if entry[1] > 0:
+                    summaries.append(entry)
+            entry = dedup.get(key)
+            if entry is None:
+                dedup[key] = [log_time, 0, level, msg, args]
+                if len(dedup) > Logger.dedupMaxKeys:
+                    entry = dedup.popitem(last=False)[1]
+                    if entry[1] > 0:
+                        summaries.append(entry)
+                duplicate = False
+            else:
+                entry[1] += 1
+                entry[4] = args
+                duplicate = True
+                if self._dedupTimer is None:
+                    self._dedupTimer = scheduler.schedule(entry[0] + window - log_time, self.__expireDedup)
+        if summaries:
+            self.__logDedupSummaries(summaries)
+        return duplicate
+
+    def __expireDedup(self, flushAll=False):
+        # Called by the shared scheduler to write the summaries of expired entries and by stop.
+        dedup = self._dedup
+        summaries = []
+        with self._dedupLock:
+            if self._dedupTimer is not None:
+                scheduler.cancel(self._dedupTimer)
+                self._dedupTimer = None
+            expired = float("inf") if flushAll else time_time() - Logger.dedupWindow
+            while dedup:
+                entry = next(iter(dedup.values()))
+                if entry[0] > expired:
+                    self._dedupTimer = scheduler.schedule(entry[0] - expired, self.__expireDedup)
+                    break
+                dedup.popitem(last=False)
+                if entry[1] > 0:
+                    summaries.append(entry)
+        if summaries:
+            self.__logDedupSummaries(summaries)
+
+    def __logDedupSummaries(self, summaries):
+        self.logMany([(level, "%d times: %s", (cnt, msg % args if args else msg))
+                      for _, cnt, level, msg, args in summaries])
+
+    def __capture(self, record):
+        if self._captureThread:
+            record.thread = current_thread().name
+        if self._captureCaller:
+            # noinspection PyProtectedMember
+            frame = sys._getframe(3)
+            record.caller = f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno}"
 
     def logEntry(self, log_time, domain, level, msg, kwargs):
-        self.__log(level, msg, None, kwargs, domain, log_time)
+        record = LogRecord.fromKwargs(log_time, domain, level, msg, kwargs)
+        self.__log(level, msg, None, record.exc_info, record.color, record.console, record.extra, domain, log_time)
 
-    def log(self, level, msg, *args, **kwargs):
-        self.__log(level, msg, args, kwargs)
+    def log(self, level, msg, *args, exc_info=None, color=None, console=False, extra=None, **kwargs):
+        self.__log(level, msg, args, exc_info, color, console, _Extra(extra, kwargs) if kwargs else extra)
 
-    def debug(self, msg, *args, **kwargs):
-        if self.level <= DEBUG:
-            self.__log(DEBUG, msg, args, kwargs)
+    def debug(self, msg, *args, exc_info=None, color=None, console=False, extra=None, **kwargs):
+        if self._level <= DEBUG:
+            self.__log(DEBUG, msg, args, exc_info, color, console, _Extra(extra, kwargs) if kwargs else extra)
 
-    def info(self, msg, *args, **kwargs):
-        if self.level <= INFO:
-            self.__log(INFO, msg, args, kwargs)
+    def info(self, msg, *args, exc_info=None, color=None, console=False, extra=None, **kwargs):
+        if self._level <= INFO:
+            self.__log(INFO, msg, args, exc_info, color, console, _Extra(extra, kwargs) if kwargs else extra)
 
-    def warning(self, msg, *args, **kwargs):
-        if self.level <= WARNING:
-            self.__log(WARNING, msg, args, kwargs)
+    def warning(self, msg, *args, exc_info=None, color=None, console=False, extra=None, **kwargs):
+        if self._level <= WARNING:
+            self.__log(WARNING, msg, args, exc_info, color, console, _Extra(extra, kwargs) if kwargs else extra)
 
-    def error(self, msg, *args, **kwargs):
-        if self.level <= ERROR:
-            self.__log(ERROR, msg, args, kwargs)
+    def error(self, msg, *args, exc_info=None, color=None, console=False, extra=None, **kwargs):
+        if self._level <= ERROR:
+            self.__log(ERROR, msg, args, exc_info, color, console, _Extra(extra, kwargs) if kwargs else extra)
 
-    def fatal(self, msg, *args, **kwargs):
-        if self.level <= FATAL:
-            self.__log(FATAL, msg, args, kwargs)
+    def fatal(self, msg, *args, exc_info=None, color=None, console=False, extra=None, **kwargs):
+        if self._level <= FATAL:
+            self.__log(FATAL, msg, args, exc_info, color, console, _Extra(extra, kwargs) if kwargs else extra)
 
-    def critical(self, msg, *args, **kwargs):
-        if self.level <= FATAL:
-            self.__log(FATAL, msg, args, kwargs)
+    def critical(self, msg, *args, exc_info=None, color=None, console=False, extra=None, **kwargs):
+        if self._level <= FATAL:
+            self.__log(FATAL, msg, args, exc_info, color, console, _Extra(extra, kwargs) if kwargs else extra)
 
-    def exception(self, msg, *args, **kwargs):
-        if self.level <= EXCEPTION:
-            kwargs["exc_info"] = traceback.format_exc()
-            self.__log(EXCEPTION, msg, args, kwargs)
+    def exception(self, msg, *args, color=None, console=False, extra=None, **kwargs):
+        if self._level <= EXCEPTION:
+            self.__log(EXCEPTION, msg, args, traceback.format_exc(), color, console,
+                       _Extra(extra, kwargs) if kwargs else extra)
+
+    def logMany(self, records):
+        # Log a batch of (level, msg, args) tuples or LogRecord instances. The batch is queued with a
+        # single queue operation and written with a single join.
+        if self.stopped:
+            raise RuntimeError("Logger already stopped")
+        minLevel = self._level
+        logTime = time_time()
+        domain = self.domain
+        batch = []
+        for record in records:
+            if record.__class__ is not LogRecord:
+                level, msg, args = record
+                if level < minLevel:
+                    continue
+                record = LogRecord(logTime, domain, level, msg, args or None)
+            elif record.level < minLevel:
+                continue
+            batch.append(record)
+        if not batch:
+            return
+        if Logger.queue is not None:
+            Logger.queue.putMany(batch)
+            return
+        if Logger.flightRecorder is not None:
+            for record in batch:
+                Logger.flightRecorder.record(record)
+        sink = self._sink
+        if sink is not None and sink._thread is not None:
+            deferFormat = Logger.deferFormat
+            if deferFormat != "all":
+                for record in batch:
+                    if record.args and (deferFormat is None or not IMMUTABLE_TYPES.issuperset(map(type, record.args))):
+                        record.getMessage()
+            sink.queue.append((self, batch))
+            sink.evtQueue.set()
+        else:
+            self._logMessages(batch)
 
     def stop(self, now=False):
-        if self._thrTimer is not None:
-            self._thrTimer.cancel()
-            self._thrTimer.join()
-            self._thrTimer = None
-            self._logMessage(self._lastMsg.key, self._lastMsg.entry, self._lastMsg.cnt)
+        if self._limiter is not None and not self.stopped:
+            self.__reportSuppressed()
+        if self._lastMsgTimer is not None:
+            self.__flushLastMsg()
+        if self._dedup and not self.stopped:
+            self.__expireDedup(True)
         self.stopNetwork()
-        if self._thrLogger is None and self.F is not None:
-            self.__writePending()
-            self.F.flush()
-            self.F.close()
-            self.F = None
-        if now:
-            self.common.queue.clear()
-        self.common.queue.append(None)
-        self.common.evtQueue.set()
+        if Logger.queue is not None:
+            Logger.queue.flush()
+        if self._fileSink is not None and not self.stopped:
+            self._fileSink.release(now)
         self.stopped = True
 
     def join(self):
-        if self._thrLogger is not None:
-            self._thrLogger.join()
-            self._thrLogger = None
+        if self._fileSink is not None:
+            self._fileSink.join()
+        _UnlinkDomain(self)
         del domains[self.domain]
         if not domains and Logger.thrConsoleLogger is not None:
             Logger.thrConsoleLogger.append(None)
@@ -305,194 +1319,153 @@ class Logger(object):
     def flush(self):
         if hasattr(self, "client"):
             self.client.evtSent.wait()
-        if self._thrLogger is None and self.F is not None:
-            self.__writePending()
-            self.F.flush()
+        if Logger.queue is not None:
+            Logger.queue.flush()
+        if self._sink is not None:
+            self._sink.flush()
 
-    def __rotate(self):
-        self.__writePending()
-        self.F.flush()
-        self.F.close()
-        self.pos = 0
-        pathName = self.pathName
-        dirName, logFileName = os.path.split(pathName)
-        zExt = "" if Logger.compress is None else Logger.compress[1]
-        fileNames = {fileName for fileName in os.listdir(dirName if dirName else ".")
-                     if fileName.startswith(logFileName)}
-        # noinspection PyBroadException
-        try:
-            for cnt in range(self.common.backupCnt, 1, -1):
-                srcFileName = f"{logFileName}.{cnt - 1}{zExt}"
-                if srcFileName not in fileNames:
-                    continue
-                os.replace(path_join(dirName, srcFileName), path_join(dirName, f"{logFileName}.{cnt}{zExt}"))
-        except:
-            pass
-        dstFileName = f"{logFileName}.1{zExt}"
-        if Logger.compress is None:
-            os.replace(pathName, path_join(dirName, dstFileName))
-        else:
-            with open(path_join(dirName, dstFileName), "wb") as Z:
-                Z.write(Logger.compress[0].compress(open(pathName, "rb").read()))
-            os.remove(pathName)
-        self.F = open(pathName, "a", encoding=Logger.encoding)
+    def setRotatePolicy(self, policy=None):
+        # The policy is set for the log file this logger writes to. If None the default is used.
+        if self._sink is not None:
+            self._sink.setRotatePolicy(Logger.rotatePolicy if policy is None else policy)
+
+    def setFlushPolicy(self, policy=None):
+        # The policy is set for the log file this logger writes to. If None the default is used.
+        if self._sink is not None:
+            self._sink.setFlushPolicy(Logger.flushPolicy if policy is None else policy)
 
     def rotate(self, bWait=False):
-        if self.F is not None:
-            if Logger.useThreads:
-                self.common.evtRotate.set()
-                self.common.evtQueue.set()
-                if bWait:
-                    while self.common.evtQueue.is_set():
-                        time.sleep(0.01)
-            else:
-                self.__rotate()
-
-    def __writePending(self):
-        if self.buf:
-            if Logger.cbWriter is None:
-                with self.lock:
-                    data = "".join(self.buf)
-                    del self.buf[:]
-                    self.size = 0
-                self.F.write(data)
-            else:
-                Logger.cbWriter(self)
+        if self._sink is not None:
+            self._sink.rotate(bWait)
 
-    def _logMessage(self, key, entry, cnt):
-        # entry = (logTime, domain, level, msg, kwargs)
-        logTime, domain, level, msg, kwargs = entry  # logTime, domain, level, msg, kwargs
-        if Logger.cbFormatter is None:
-            sTime = time_strftime(Logger.dateFmt, time_localtime(logTime))
-            if self._indent_inc > 0:
-                depth = -self._indent_offset
-                # noinspection PyProtectedMember
-                frame = sys._getframe(3).f_back
-                while frame:
-                    frame = frame.f_back
-                    depth += 1
-                if depth > 0:
-                    msg = " " * min(depth * self._indent_inc, self._indent_max) + msg
-            if "exc_info" in kwargs:
-                message = f"{sTime}: {domain}: {LOG2SYM[level]}: {msg}\n{kwargs['exc_info']}"
+    def __formatMessage(self, record):
+        msg = record.msg if record.args is None else record.getMessage()
+        if Logger.cbFormatter is not None:
+            return Logger.cbFormatter(self, record)
+        if self._indent_frames:
+            depth = -self._indent_offset
+            # noinspection PyProtectedMember
+            frame = sys._getframe(4).f_back
+            while frame:
+                frame = frame.f_back
+                depth += 1
+            if depth > 0:
+                msg = " " * min(depth * self._indent_inc, self._indent_max) + msg
+        domain = record.domain
+        fmtMessage = self._layouts.get(domain)
+        if fmtMessage is None:
+            fmtMessage = self._layouts[domain] = CompileLayout(self._layout, domain, self._fmtTime,
+                                                               LOG2SYM, LOG2SSYM)
+        if record.exc_info is None:
+            return fmtMessage(record, msg)
+        return f"{fmtMessage(record, msg)}\n{record.exc_info}"
+
+    def __printMessage(self, record, message):
+        level = record.level
+        if Logger.colors:
+            color = record.color
+            if color is None:
+                color = LVL2COL.get(level, Colors.RED)
+            message = f"{color}{message}{Colors.RESETALL}"
+        if Logger.thrConsoleLogger is None:
+            if Logger.consoleLock is None:
+                print(message, file=self.stdout if level < ERROR else self.stderr)
             else:
-                message = f"{sTime}: {domain}: {LOG2SYM[level]}: {msg}"
+                with Logger.consoleLock:
+                    print(message, file=self.stdout if level < ERROR else self.stderr)
         else:
-            message = Logger.cbFormatter(self, entry)
+            Logger.thrConsoleLogger.append((level, message))
+
+    def _logMessage(self, key, record, cnt):
+        message = self.__formatMessage(record)
         if key is not None:
             if cnt > 0:
                 message = f"{cnt} times: {message}"
             self._lastMsg.key = key
             self._lastMsg.cnt = 1
-            self._lastMsg.entry = entry
+            self._lastMsg.record = record
         if Logger.backlog is not None:
-            Logger.backlog.append(entry)
-        # noinspection PyBroadException
-        try:
-            if self.F is not None:
-                size = len(message) + 1
-                with self.lock:
-                    self.buf.append(message + "\n")
-                    self.size += size
-                if self.common.maxSize == 0:
-                    if (self.size >= 4096) or not Logger.useThreads:
-                        self.__writePending()
-                else:
-                    self.pos += size
-                    if self.pos >= self.common.maxSize:
-                        if Logger.useThreads:
-                            self.common.evtRotate.set()
-                        else:
-                            self.__rotate()
-        except:
-            errMsg = traceback.format_exc()
-            if Logger.backlog is not None:
-                Logger.backlog.append((logTime, domain, FATAL, errMsg, None))
-            print(f"{Colors.RED}{errMsg}{Colors.RESETALL}", file=self.stderr)
-        if self._console or kwargs.get("console", False):
-            if Logger.colors:
-                if "color" in kwargs:
-                    color = kwargs["color"]
-                else:
-                    color = LVL2COL.get(level, FATAL)
-                message = f"{color}{message}{Colors.RESETALL}"
-            if Logger.thrConsoleLogger is None:
-                if Logger.consoleLock is None:
-                    print(message, file=self.stdout if level < ERROR else self.stderr)
-                else:
-                    with Logger.consoleLock:
-                        print(message, file=self.stdout if level < ERROR else self.stderr)
-            else:
-                Logger.thrConsoleLogger.append((level, message))
+            Logger.backlog.append(record)
+        sink = self._sink
+        if sink is not None:
+            sink.append(record, message, record.level)
+        if self._console or record.console:
+            self.__printMessage(record, message)
         if hasattr(self, "client"):
-            self.client.log(entry)
+            self.client.log(record)
 
-    def __logEntry(self, entry):
-        # entry = (logTime, domain, level, msg, kwargs)
-        if Logger.cbMessageKey is None:
-            key = entry[3]
+    def _logMessages(self, records):
+        # Format a batch of records and write them with a single join.
+        if Logger.sameMsgCountMax > 0:
+            for record in records:
+                self.__logEntry(record)
+            return
+        formatMessage = self.__formatMessage
+        messages = [formatMessage(record) for record in records]
+        if Logger.backlog is not None:
+            Logger.backlog.extend(records)
+        sink = self._sink
+        if sink is not None:
+            # The batch is written immediately if any of its records reaches FlushPolicy.level.
+            sink.append(records[-1], "\n".join(messages), max([record.level for record in records]))
+        if self._console:
+            for record, message in zip(records, messages):
+                self.__printMessage(record, message)
         else:
-            key = Logger.cbMessageKey(self, entry)
-        _lastMsg = self._lastMsg
-        if (key == _lastMsg.key) and (_lastMsg.cnt < Logger.sameMsgCountMax):
-            _lastMsg.cnt += 1
-            _lastMsg.entry = entry
-            if self._thrTimer is None:
-                # noinspection PyTypeChecker
-                self._thrTimer = Timer(Logger.sameMsgTimeout, self._logMessage, args=(key, entry, 0))
-                self._thrTimer.start()
-        elif self._thrTimer is None:
-            self._logMessage(key, entry, 0)
+            for record, message in zip(records, messages):
+                if record.console:
+                    self.__printMessage(record, message)
+        if hasattr(self, "client"):
+            for record in records:
+                self.client.log(record)
+
+    def _writeRecord(self, record):
+        # Called by the writer thread of the FileSink for queued records and batches.
+        if record.__class__ is list:
+            self._logMessages(record)
+        elif Logger.sameMsgCountMax > 0:
+            self.__logEntry(record)
         else:
-            self._thrTimer.cancel()
-            self._thrTimer.join()
-            self._thrTimer = None
-            self._logMessage(key, _lastMsg.entry, _lastMsg.cnt)
-            self._logMessage(key, entry, 0)
-
-    def __logThread(self):
-        common = self.common
-        common_evtQueue = common.evtQueue
-        common_evtRotate = common.evtRotate
-        common_queue_popleft = common.queue.popleft
-        while True:
-            try:
-                entry = common_queue_popleft()
-                if entry is None:
-                    if self.F is not None:
-                        if self.buf:
-                            self.__writePending()
-                        self.F.flush()
-                        self.F.close()
-                        self.F = None
-                    break
-            except IndexError:
-                if self.F is not None and self.buf:
-                    self.__writePending()
-                common_evtQueue.wait()
-                common_evtQueue.clear()
-                if common_evtRotate.is_set():
-                    self.__rotate()
-                    common_evtRotate.clear()
-                continue
-            # noinspection PyBroadException
-            try:
-                if Logger.sameMsgCountMax > 0:
-                    self.__logEntry(entry)
-                else:
-                    self._logMessage(None, entry, 0)
-            except:
-                errMsg = traceback.format_exc()
-                if Logger.backlog is not None:
-                    Logger.backlog.append((entry[0], entry[1], FATAL, errMsg, None))
-                print(f"{Colors.RED}{errMsg}{Colors.RESETALL}", file=self.stderr)
+            self._logMessage(None, record, 0)
+
+    def __logEntry(self, record):
+        if Logger.cbMessageKey is None:
+            key = record.getMessage()
+        else:
+            key = Logger.cbMessageKey(self, record)
+        with self._lastMsgLock:
+            _lastMsg = self._lastMsg
+            if (key == _lastMsg.key) and (_lastMsg.cnt < Logger.sameMsgCountMax):
+                _lastMsg.cnt += 1
+                _lastMsg.record = record
+                if self._lastMsgTimer is None:
+                    self._lastMsgTimer = scheduler.schedule(Logger.sameMsgTimeout, self.__flushLastMsg)
+            elif self._lastMsgTimer is None:
+                self._logMessage(key, record, 0)
+            else:
+                scheduler.cancel(self._lastMsgTimer)
+                self._lastMsgTimer = None
+                self._logMessage(key, _lastMsg.record, _lastMsg.cnt)
+                self._logMessage(key, record, 0)
+
+    def __flushLastMsg(self):
+        # Called by the shared scheduler when a run of same messages timed out and by stop.
+        with self._lastMsgLock:
+            if self._lastMsgTimer is None:
+                return
+            scheduler.cancel(self._lastMsgTimer)
+            self._lastMsgTimer = None
+            _lastMsg = self._lastMsg
+            self._logMessage(_lastMsg.key, _lastMsg.record, _lastMsg.cnt)
 
 
 def Remove(domain=None, now=False):
     if domain is None:
         domain = "root"
     if domain in domains:
-        domains[domain].stop(now)
+        logger = domains[domain]
+        _UnlinkDomain(logger)
+        logger.stop(now)
         del domains[domain]
         return True
     return False
@@ -515,22 +1488,28 @@ def GetLogger(domain=None, level=NOTSET, pathName=None, maxSize=0, backupCnt=0,
         else:
             logger.stop()
             logger.join()
+    level = envLevels.get(domain, level)
     logger = domains[domain] = Logger(domain, level, pathName, maxSize, backupCnt, console, indent, server, connect)
+    _LinkDomain(logger)
     return logger
 
 
 def LogInit(domain=None, level=NOTSET, pathName=None, maxSize=0, backupCnt=0, console=False,
             colors=False, compress=None, useThreads=False, encoding=None, backlog=0,
-            indent=None, server=None, connect=None, consoleLock=None, stdout=None, stderr=None):
+            indent=None, server=None, connect=None, consoleLock=None, stdout=None, stderr=None, deferFormat=None,
+            backlogBytes=0):
+    if deferFormat not in (None, "immutable", "all"):
+        raise ValueError("Invalid deferFormat")
     if domain is None:
         domain = "root"
     Logger.colors = colors
     Logger.compress = compress
     Logger.useThreads = useThreads
+    Logger.deferFormat = deferFormat
     Logger.encoding = encoding
     Logger.console = console
     Logger.indent = indent
-    Logger.setBacklog(backlog)
+    Logger.setBacklog(backlog, backlogBytes)
     Logger.consoleLock = consoleLock
     Logger.stdout = stdout if stdout is not None else sys.stdout
     Logger.stderr = stderr if stderr is not None else sys.stderr
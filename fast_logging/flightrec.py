@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Martin Bammer. All Rights Reserved.
+# Licensed under MIT license.
+
+"""Memory mapped flight recorder, which keeps the latest log records in a ring file."""
+
+import os
+import mmap
+import time
+import struct
+import signal
+import faulthandler
+from threading import Lock
+
+from fast_logging.fastlogging import DEBUG, LOG2SYM
+from fast_logging.record import LogRecord
+
+
+MAGIC = b"FLREC001"
+# magic, capacity, head, tail, seq. head and tail are absolute byte positions in the record stream.
+HEADER = struct.Struct("<8sQQQQ")
+HEADER_SIZE = 64
+# Payload length, sequence number, time, level. The payload is the domain, a NUL byte and the message.
+FRAME = struct.Struct("<IQdi")
+
+
+class FlightRecorder(object):
+    """Keep the latest log records in a memory mapped ring file.
+
+    Records are written into the shared mapping of the file. So they are held by the page cache and
+    survive a crash, OOM kill or SIGKILL of the process without any system call per record. The
+    header is updated after a record was copied, so a record interrupted by a crash is ignored by
+    the reader. Records with level >= level are recorded, even if the level of the logger is higher.
+    """
+
+    def __init__(self, pathName, size=4 * 1024 * 1024, level=DEBUG):
+        self.pathName = pathName
+        self.level = level
+        self.lock = Lock()
+        self.F = os.fdopen(os.open(pathName, os.O_RDWR | os.O_CREAT, 0o644), "r+b")
+        header = self.F.read(HEADER_SIZE)
+        if len(header) == HEADER_SIZE:
+            magic, capacity, head, tail, seq = HEADER.unpack_from(header)
+        else:
+            magic = None
+        if magic != MAGIC or capacity != size:
+            # Start with an empty ring. Otherwise the records of the previous run are kept.
+            self.F.truncate(0)
+            self.F.truncate(HEADER_SIZE + size)
+            capacity, head, tail, seq = size, 0, 0, 0
+        self.mm = mmap.mmap(self.F.fileno(), HEADER_SIZE + size)
+        self.capacity = capacity
+        self.maxPayload = capacity // 4
+        self.head = head
+        self.tail = tail
+        self.seq = seq
+        HEADER.pack_into(self.mm, 0, MAGIC, capacity, head, tail, seq)
+        self._faultFile = None
+
+    def __put(self, pos, data):
+        offset = pos % self.capacity
+        first = self.capacity - offset
+        start = HEADER_SIZE + offset
+        if len(data) <= first:
+            self.mm[start:start + len(data)] = data
+        else:
+            self.mm[start:start + first] = data[:first]
+            self.mm[HEADER_SIZE:HEADER_SIZE + len(data) - first] = data[first:]
+
+    def write(self, logTime, domain, level, msg):
+        payload = f"{domain}\0{msg}".encode("utf-8", "replace")
+        if len(payload) > self.maxPayload:
+            payload = payload[:self.maxPayload]
+        size = FRAME.size + len(payload)
+        with self.lock:
+            seq = self.seq + 1
+            head = self.head
+            tail = self.tail
+            if head + size - tail > self.capacity:
+                # Drop the oldest records. The tail is published first, so the reader never reads
+                # a record which is being overwritten.
+                while head + size - tail > self.capacity:
+                    tail += FRAME.size + FRAME.unpack(_read(self.mm, self.capacity, tail, FRAME.size))[0]
+                self.tail = tail
+                struct.pack_into("<Q", self.mm, 24, tail)
+            self.__put(head, FRAME.pack(len(payload), seq, logTime, level) + payload)
+            self.head = head = head + size
+            self.seq = seq
+            struct.pack_into("<QQ", self.mm, 16, head, tail)
+            struct.pack_into("<Q", self.mm, 32, seq)
+
+    def record(self, record):
+        if record.level >= self.level:
+            msg = record.getMessage()
+            if record.exc_info:
+                msg = f"{msg}\n{record.exc_info}"
+            self.write(record.time, record.domain, record.level, msg)
+
+    def records(self):
+        with self.lock:
+            return _readRecords(self.mm)
+
+    def flush(self):
+        """Write the mapping to disk. Only needed to survive a power loss or kernel crash."""
+        self.mm.flush()
+
+    def dump(self, F):
+        """Write the recorded messages as text to file object F."""
+        # The lock is not acquired, because dump is called by signal handlers, which could interrupt write.
+        for record in _readRecords(self.mm):
+            F.write(FormatRecord(record) + "\n")
+        F.flush()
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.flush()
+            self.mm.close()
+            self.mm = None
+            self.F.close()
+
+
+def _read(mm, capacity, pos, size):
+    offset = pos % capacity
+    first = capacity - offset
+    start = HEADER_SIZE + offset
+    if size <= first:
+        return mm[start:start + size]
+    return mm[start:start + first] + mm[HEADER_SIZE:HEADER_SIZE + size - first]
+
+
+def _readRecords(mm):
+    magic, capacity, head, tail, seq = HEADER.unpack_from(mm, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a flight recorder file")
+    records = []
+    pos = tail
+    while pos + FRAME.size <= head:
+        length, seq, logTime, level = FRAME.unpack(_read(mm, capacity, pos, FRAME.size))
+        if pos + FRAME.size + length > head:
+            break
+        domain, _, msg = _read(mm, capacity, pos + FRAME.size, length).decode("utf-8", "replace").partition("\0")
+        records.append(LogRecord(logTime, domain, level, msg))
+        pos += FRAME.size + length
+    return records
+
+
+def ReadFlightRecorder(pathName):
+    """Return the records of a flight recorder file as a list of LogRecord instances, oldest first."""
+    with open(pathName, "rb") as F:
+        return _readRecords(F.read())
+
+
+def FormatRecord(record):
+    tm = time.strftime("%y.%m.%d %H:%M:%S", time.localtime(record.time))
+    level = LOG2SYM.get(record.level, record.level)
+    return f"{tm}.{int(record.time % 1 * 1000000):06d}: {record.domain}: {level}: {record.msg}"
+
+
+def InstallDumpHook(recorder, pathName=None, signals=(signal.SIGTERM,)):
+    """Dump the flight recorder on fatal signals.
+
+    faulthandler is enabled to write the tracebacks of all threads on SIGSEGV, SIGFPE, SIGABRT,
+    SIGBUS and SIGILL into the dump file (default recorder.pathName + ".dump"). The records itself
+    survive these signals in the ring file. For the given catchable signals the records are also
+    written as text into the dump file, before the previous signal handler is called.
+    """
+    if pathName is None:
+        pathName = recorder.pathName + ".dump"
+    recorder._faultFile = F = open(pathName, "a")
+    faulthandler.enable(F, all_threads=True)
+
+    def Handler(signum, frame):
+        F.write(f"Fatal signal {signum}, flight recorder {recorder.pathName}:\n")
+        recorder.dump(F)
+        faulthandler.dump_traceback(F, all_threads=True)
+        recorder.flush()
+        previous = previousHandlers[signum]
+        if callable(previous):
+            previous(signum, frame)
+        else:
+            signal.signal(signum, signal.SIG_DFL if previous is None else previous)
+            os.kill(os.getpid(), signum)
+
+    previousHandlers = {}
+    for signum in signals:
+        previousHandlers[signum] = signal.signal(signum, Handler)
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Martin Bammer. All Rights Reserved.
+# Licensed under MIT license.
+
+"""Print the records of a flight recorder ring file.
+
+Usage: python -m fast_logging.flightrecdump <ring file>
+"""
+
+import sys
+
+from fast_logging.flightrec import ReadFlightRecorder, FormatRecord
+
+
+def Main(argv):
+    if len(argv) != 2:
+        print(f"Usage: {sys.executable} -m fast_logging.flightrecdump <ring file>", file=sys.stderr)
+        return 1
+    for record in ReadFlightRecorder(argv[1]):
+        print(FormatRecord(record))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(Main(sys.argv))
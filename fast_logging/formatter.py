@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Martin Bammer. All Rights Reserved.
+# Licensed under MIT license.
+
+"""Fast message formatting."""
+
+import os
+import time
+import string
+from threading import Lock
+
+
+# Sub second directives which are not supported by time.strftime.
+SUBSEC_DIRECTIVES = {"%f": 1,       # Microseconds (6 digits)
+                     "%3f": 1000}   # Milliseconds (3 digits)
+
+
+class TimeFormatter(object):
+    """Render log times with a compiled date format.
+
+    The date format is split once into strftime segments and sub second directives. The strftime
+    part is rendered once per second and cached. Because the cache is keyed by the epoch second
+    changes of the UTC offset (DST) are picked up with the first record of the next second.
+    Sub second values are appended arithmetically.
+    """
+
+    def __init__(self, dateFmt, utc=False):
+        self.dateFmt = dateFmt
+        self.utc = utc
+        self._convert = time.gmtime if utc else time.localtime
+        self._segments = []  # strftime segments, escaped for the %-operator
+        self._divs = []      # Divisors of the sub second directives
+        segment = []
+        pos = 0
+        end = len(dateFmt)
+        while pos < end:
+            if dateFmt[pos] != "%" or pos + 1 >= end:
+                segment.append(dateFmt[pos])
+                pos += 1
+                continue
+            for directive, div in SUBSEC_DIRECTIVES.items():
+                if dateFmt.startswith(directive, pos):
+                    self._segments.append("".join(segment))
+                    self._divs.append(div)
+                    segment = []
+                    pos += len(directive)
+                    break
+            else:
+                segment.append(dateFmt[pos:pos + 2])
+                pos += 2
+        self._segments.append("".join(segment))
+        self._divs = tuple(self._divs)
+        self._cache = (None, None)
+        if not self._divs:
+            self.format = self._formatSec
+        elif len(self._divs) == 1:
+            self._div = self._divs[0]
+            self.format = self._formatSubSec1
+        else:
+            self.format = self._formatSubSec
+
+    def reset(self):
+        """Drop the cached prefix, e.g. after time.tzset was called."""
+        self._cache = (None, None)
+
+    def _render(self, sec):
+        tm = self._convert(sec)
+        if not self._divs:
+            return time.strftime(self._segments[0], tm)
+        parts = []
+        for segment, div in zip(self._segments, self._divs):
+            parts.append(time.strftime(segment, tm).replace("%", "%%"))
+            parts.append("%03d" if div == 1000 else "%06d")
+        parts.append(time.strftime(self._segments[-1], tm).replace("%", "%%"))
+        return "".join(parts)
+
+    def _formatSec(self, logTime):
+        sec = int(logTime)
+        cache = self._cache
+        if cache[0] != sec:
+            cache = self._cache = (sec, self._render(sec))
+        return cache[1]
+
+    def _formatSubSec1(self, logTime):
+        sec = int(logTime)
+        cache = self._cache
+        if cache[0] != sec:
+            cache = self._cache = (sec, self._render(sec))
+        return cache[1] % (int((logTime - sec) * 1000000) // self._div)
+
+    def _formatSubSec(self, logTime):
+        sec = int(logTime)
+        cache = self._cache
+        if cache[0] != sec:
+            cache = self._cache = (sec, self._render(sec))
+        usec = int((logTime - sec) * 1000000)
+        return cache[1] % tuple([usec // div for div in self._divs])
+
+    def __call__(self, logTime):
+        return self.format(logTime)
+
+
+_timeFormatters = {}
+_timeFormattersLock = Lock()
+
+
+def GetTimeFormatter(dateFmt, utc=False):
+    """Return a shared TimeFormatter instance, so that loggers with the same format share one cache."""
+    key = (dateFmt, utc)
+    formatter = _timeFormatters.get(key)
+    if formatter is None:
+        with _timeFormattersLock:
+            formatter = _timeFormatters.get(key)
+            if formatter is None:
+                formatter = _timeFormatters[key] = TimeFormatter(dateFmt, utc)
+    return formatter
+
+
+def _extras(extra):
+    if not extra:
+        return ""
+    return " ".join([f"{key}={value}" for key, value in extra.items()])
+
+
+def _extra(extra, name):
+    if not extra:
+        return ""
+    return extra.get(name, "")
+
+
+def ParseLayout(layout):
+    """Split a layout into a list of (fieldName, formatSpec, conversion) tuples.
+
+    Literal text is returned as (None, text, None).
+    """
+    tokens = []
+    for literal, fieldName, formatSpec, conversion in string.Formatter().parse(layout):
+        if literal:
+            tokens.append((None, literal, None))
+        if fieldName is None:
+            continue
+        if fieldName not in LAYOUT_FIELDS and not fieldName.startswith("extra."):
+            raise ValueError(f"Invalid layout field {fieldName!r}")
+        if conversion not in (None, "r", "s", "a"):
+            raise ValueError(f"Invalid conversion {conversion!r} of layout field {fieldName!r}")
+        if "{" in formatSpec or "}" in formatSpec:
+            raise ValueError(f"Nested replacement fields are not supported in layout field {fieldName!r}")
+        tokens.append((fieldName, formatSpec, conversion))
+    return tokens
+
+
+# Layout fields which are evaluated for each log message and the expressions to evaluate them.
+LAYOUT_FIELDS = {"time": "_fmtTime(record.time)",
+                 "domain": None,      # Constant per domain
+                 "level": None,       # Constant per level
+                 "lvl": None,         # Constant per level (short symbol)
+                 "message": "msg",
+                 "thread": "(record.thread or '')",
+                 "caller": "(record.caller or '')",
+                 "pid": "_getpid()",
+                 "extras": "_extras(record.extra)"}
+
+
+def CompileLayout(layout, domain, fmtTime, level2sym, level2ssym):
+    """Compile a layout into a function fmtMessage(record, msg) which returns the log message.
+
+    Constant parts, the domain and the level symbols are folded into per level prefixes, which are
+    computed only once. The remaining fields are evaluated by a single f-string.
+    """
+    namespace = {"_fmtTime": fmtTime, "_getpid": os.getpid, "_extras": _extras, "_extra": _extra}
+    exprs = []
+    group = []  # Consecutive constant and per level parts
+
+    def FoldGroup():
+        if not group:
+            return
+        name = f"_c{len(namespace)}"
+        if any(part.__class__ is dict for part in group):
+            namespace[name] = {level: "".join([part if part.__class__ is str else part[level] for part in group])
+                               for level in level2sym}
+            exprs.append(f"{{{name}[record.level]}}")
+        else:
+            namespace[name] = "".join(group)
+            exprs.append(f"{{{name}}}")
+        del group[:]
+
+    for fieldName, formatSpec, conversion in ParseLayout(layout):
+        if fieldName is None:
+            group.append(formatSpec)
+        elif fieldName == "domain":
+            group.append(format(_convert(domain, conversion), formatSpec))
+        elif fieldName in ("level", "lvl"):
+            symbols = level2sym if fieldName == "level" else level2ssym
+            group.append({level: format(_convert(symbol, conversion), formatSpec) for level, symbol in symbols.items()})
+        else:
+            FoldGroup()
+            if fieldName.startswith("extra."):
+                expr = f"_extra(record.extra, {fieldName[6:]!r})"
+            else:
+                expr = LAYOUT_FIELDS[fieldName]
+            if formatSpec:
+                # The format spec is passed as constant, so it is not parsed as part of the source.
+                specName = f"_s{len(namespace)}"
+                namespace[specName] = formatSpec
+                formatSpec = f":{{{specName}}}"
+            exprs.append("{" + expr + (f"!{conversion}" if conversion else "") + formatSpec + "}")
+    FoldGroup()
+    source = f"def fmtMessage(record, msg):\n    return f\"{''.join(exprs)}\"\n"
+    exec(source, namespace)
+    fmtMessage = namespace["fmtMessage"]
+    fmtMessage.source = source
+    return fmtMessage
+
+
+def _convert(value, conversion):
+    if conversion == "r":
+        return repr(value)
+    if conversion == "s":
+        return str(value)
+    if conversion == "a":
+        return ascii(value)
+    return value
+
+
+class Lazy(object):
+    """Lazy log message argument.
+
+    The callable is only called when the log message is formatted, that is after the message passed the
+    level check and, if configured, in the writer thread. The result is cached.
+    """
+
+    __slots__ = ("func", "args", "kwargs", "_value")
+
+    _unset = object()
+
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self._value = Lazy._unset
+
+    @property
+    def value(self):
+        value = self._value
+        if value is Lazy._unset:
+            value = self._value = self.func(*self.args, **self.kwargs)
+        return value
+
+    def __str__(self):
+        return str(self.value)
+
+    def __repr__(self):
+        return repr(self.value)
+
+    def __format__(self, formatSpec):
+        return format(self.value, formatSpec)
+
+    def __int__(self):
+        return int(self.value)
+
+    def __index__(self):
+        return self.value.__index__()
+
+    def __float__(self):
+        return float(self.value)
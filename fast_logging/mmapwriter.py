@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Martin Bammer. All Rights Reserved.
+# Licensed under MIT license.
+
+"""Append writer, which copies log data into memory mapped preallocated segments of the log file."""
+
+import os
+import mmap
+
+
+def _Allocate(fd, offset, size):
+    if hasattr(os, "posix_fallocate"):
+        os.posix_fallocate(fd, offset, size)
+    else:
+        # Not available on macOS and Windows. The file is extended sparse.
+        os.ftruncate(fd, offset + size)
+
+
+def FindValidEnd(fd, chunkSize=65536):
+    """Return the length of the log data in file descriptor fd without the NUL bytes of preallocated space.
+
+    Log messages don't contain NUL bytes, so after a crash the valid end is found by scanning
+    backwards for the last byte which is not NUL.
+    """
+    end = os.fstat(fd).st_size
+    while end > 0:
+        start = max(0, end - chunkSize)
+        data = os.pread(fd, end - start, start)
+        stripped = data.rstrip(b"\0")
+        if stripped:
+            return start + len(stripped)
+        end = start
+    return 0
+
+
+class MmapWriter(object):
+    """Append data to an open file by copying it into a memory mapping of the file.
+
+    The file is extended in segments of segmentSize bytes with posix_fallocate and only the current
+    segment is mapped. So a write is a memory copy and system calls are only needed once per
+    segment. The file is truncated to the length of the written data by close. When a file is
+    opened, NUL bytes at its end, which remain of a crash, are removed first.
+    """
+
+    def __init__(self, fd, segmentSize=4 * 1024 * 1024):
+        granularity = mmap.ALLOCATIONGRANULARITY
+        self.fd = fd
+        self.segmentSize = max(granularity, (segmentSize + granularity - 1) // granularity * granularity)
+        self.pos = FindValidEnd(fd)
+        os.ftruncate(fd, self.pos)
+        self.mm = None
+        self._start = 0   # File position of the mapped segment
+        self._end = 0     # File position of the end of the mapped segment
+
+    def __map(self):
+        if self.mm is not None:
+            self.mm.close()
+        self._start = self.pos - self.pos % self.segmentSize
+        self._end = self._start + self.segmentSize
+        _Allocate(self.fd, self.pos, self._end - self.pos)
+        self.mm = mmap.mmap(self.fd, self.segmentSize, offset=self._start)
+
+    def write(self, data):
+        size = len(data)
+        pos = self.pos
+        if pos + size <= self._end:
+            offset = pos - self._start
+            self.mm[offset:offset + size] = data
+            self.pos = pos + size
+            return
+        view = memoryview(data)
+        while view:
+            if self.pos >= self._end:
+                self.__map()
+            offset = self.pos - self._start
+            cnt = min(len(view), self._end - self.pos)
+            self.mm[offset:offset + cnt] = view[:cnt]
+            self.pos += cnt
+            view = view[cnt:]
+
+    def flush(self):
+        if self.mm is not None:
+            self.mm.flush()
+
+    def close(self):
+        """Unmap the segment and truncate the file to the length of the written data."""
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        os.ftruncate(self.fd, self.pos)
+        self._start = self._end = 0
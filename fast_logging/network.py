@@ -15,6 +15,8 @@ from threading import Thread, Event, Lock
 
 import msgpack
 
+from fast_logging.record import LogRecord
+
 
 class LoggingServer(Thread):
 
@@ -156,11 +158,12 @@ class LoggingServer(Thread):
                                     if cbDecode is None:
                                         logtime, domain, level, message, kwargs = msgpack_unpackb(message, use_list=False)
                                         logMessage(None,
-                                                   (logtime, str(domain, "utf-8"), level,
-                                                    prefix + str(message, "utf-8") + " %.3f" % (time_time() - t0), kwargs),
+                                                   LogRecord.fromKwargs(logtime, str(domain, "utf-8"), level,
+                                                                        prefix + str(message, "utf-8") +
+                                                                        " %.3f" % (time_time() - t0), kwargs),
                                                    0)
                                     else:
-                                        logMessage(None, cbDecode(prefix, message), 0)
+                                        logMessage(None, LogRecord.fromEntry(cbDecode(prefix, message)), 0)
                             elif isinstance(messages, bytes):
                                 prefix = str(messages, "utf-8") + ": "
                             rPos = (rPos + size) % bufLen
@@ -201,8 +204,8 @@ class LoggingClient(Thread):
         self.evtQueue.set()
         self.join()
 
-    def log(self, entry):
-        self.queue.append(entry)
+    def log(self, record):
+        self.queue.append(record)
         self.evtQueue.set()
 
     def run(self):
@@ -235,7 +238,7 @@ class LoggingClient(Thread):
                 try:
                     while True:
                         if cbEncode is None:
-                            message = msgpack_packb(queue_popleft(), use_bin_type=True)
+                            message = msgpack_packb(queue_popleft().asTuple(), use_bin_type=True)
                         else:
                             message = msgpack_packb(cbEncode(queue_popleft()), use_bin_type=True)
                         msgLen = len(message) + 3
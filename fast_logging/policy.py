@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Martin Bammer. All Rights Reserved.
+# Licensed under MIT license.
+
+"""Policies for writing log files."""
+
+import os
+import re
+import time
+from collections import deque
+
+
+class FlushPolicy(object):
+    """Define when buffered log messages are written to the log file.
+
+    maxBytes: Write if the buffered messages exceed this size.
+    interval: Maximum time in seconds a message stays in the buffer (None = unlimited).
+    level: Write immediately if a message with at least this level is logged (None = never).
+    sync: None, "fsync" or "fdatasync". Synchronize the log file after each write.
+    mmapSegment: If > 0, messages are copied into a memory mapping of the log file, which is extended
+                 in preallocated segments of this size (see MmapWriter). 0 writes with system calls.
+    """
+
+    def __init__(self, maxBytes=4096, interval=None, level=None, sync=None, mmapSegment=0):
+        if maxBytes < 0 or (interval is not None and interval <= 0.0) or mmapSegment < 0:
+            raise ValueError("Invalid maxBytes, interval or mmapSegment")
+        if sync not in (None, "fsync", "fdatasync"):
+            raise ValueError("Invalid sync")
+        self.maxBytes = maxBytes
+        self.interval = interval
+        self.level = level
+        self.sync = sync
+        self.mmapSegment = mmapSegment
+        if sync is None:
+            self.syncFile = None
+        elif sync == "fdatasync":
+            # fdatasync is not available on all platforms.
+            self.syncFile = getattr(os, "fdatasync", os.fsync)
+        else:
+            self.syncFile = os.fsync
+
+    def __repr__(self):
+        return f"FlushPolicy(maxBytes={self.maxBytes}, interval={self.interval}, level={self.level}, sync={self.sync!r}, " \
+               f"mmapSegment={self.mmapSegment})"
+
+
+class RotatePolicy(object):
+    """Define when log files are rotated.
+
+    maxSize: Rotate if the log file exceeds this size in bytes. None keeps maxSize of the logger, 0 disables it.
+    when: None, "hourly", "daily" or an interval in seconds. Rotate at the next boundary of this interval.
+    utc: Compute the boundaries of "hourly" and "daily" in UTC instead of local time.
+    symlink: Optional path of a symbolic link which points to the active log file.
+    archive: None, "seq" or "time". Naming of the rotated log files. None renames all backups to
+             .1, .2, ... on each rotation. "seq" (.000001, .000002, ...) and "time" (.YYYYmmdd-HHMMSS)
+             need only one rename per rotation (see ArchiveIndex).
+    preopen: Keep the next log file (with suffix .next) pre-opened. A rotation then only swaps the file
+             objects. The renames and the retention are done afterwards by a background thread.
+    shared: The log file is written by multiple processes. Rotations are serialized by a lock file
+            (suffix .lock) and the other processes reopen the log file when they detect the rotation.
+    checkBytes: With shared, the size of the log file is checked with stat after this process wrote
+                this many bytes, so the messages of the other processes are counted too.
+    """
+
+    def __init__(self, maxSize=None, when=None, utc=False, symlink=None, archive=None, preopen=False,
+                 shared=False, checkBytes=64 * 1024):
+        if maxSize is not None and maxSize < 0:
+            raise ValueError("Invalid maxSize")
+        if when not in (None, "hourly", "daily") and (isinstance(when, str) or when <= 0):
+            raise ValueError("Invalid when")
+        if archive not in (None, "seq", "time"):
+            raise ValueError("Invalid archive")
+        if shared and (preopen or os.name == "nt" or checkBytes <= 0):
+            raise ValueError("shared is not supported with preopen, on Windows or with checkBytes <= 0")
+        self.maxSize = maxSize
+        self.when = when
+        self.utc = utc
+        self.symlink = symlink
+        self.archive = archive
+        self.preopen = preopen
+        self.shared = shared
+        self.checkBytes = checkBytes
+
+    def nextRotation(self, now):
+        """Return the time of the next rotation boundary after now."""
+        when = self.when
+        if when is None:
+            return float("inf")
+        if when == "hourly":
+            interval = 3600
+        elif when == "daily":
+            interval = 86400
+        else:
+            interval = when
+        if self.utc or when == interval:
+            # Intervals in seconds are aligned to the epoch.
+            return (now // interval + 1) * interval
+        tm = time.localtime(now)
+        if when == "hourly":
+            return time.mktime((tm.tm_year, tm.tm_mon, tm.tm_mday, tm.tm_hour, 0, 0, 0, 0, -1)) + 3600
+        return time.mktime((tm.tm_year, tm.tm_mon, tm.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+
+    def __repr__(self):
+        return f"RotatePolicy(maxSize={self.maxSize}, when={self.when!r}, utc={self.utc}, symlink={self.symlink!r}, " \
+               f"archive={self.archive!r}, preopen={self.preopen}, shared={self.shared}, checkBytes={self.checkBytes})"
+
+
+class ArchiveIndex(object):
+    """In memory index of the archives of a log file, which are named by sequence number or time.
+
+    The directory is only scanned when the index is created. Afterwards a rotation is a single
+    rename and the retention removes the oldest archives from the front of the index.
+    """
+
+    def __init__(self, pathName, scheme, zExt="", utc=False):
+        self.dirName, self.logFileName = os.path.split(pathName)
+        self.scheme = scheme
+        self.utc = utc
+        self._lastStamp = None
+        self._stampCnt = 0
+        pattern = r"\d{6,}" if scheme == "seq" else r"\d{8}-\d{6}(?:-\d+)?"
+        regex = re.compile(rf"{re.escape(self.logFileName)}\.({pattern})(?:{re.escape(zExt)})?" if zExt else
+                           rf"{re.escape(self.logFileName)}\.({pattern})")
+        archives = []
+        for fileName in os.listdir(self.dirName if self.dirName else "."):
+            match = regex.fullmatch(fileName)
+            if match is not None:
+                key = match.group(1)
+                archives.append((int(key) if scheme == "seq" else key, fileName))
+        archives.sort()
+        self.archives = deque([os.path.join(self.dirName, fileName) for _, fileName in archives])
+        self.seq = archives[-1][0] + 1 if archives and scheme == "seq" else 1
+
+    def next(self, now):
+        """Return the path name for the next archive."""
+        if self.scheme == "seq":
+            name = f"{self.seq:06d}"
+            self.seq += 1
+        else:
+            name = time.strftime("%Y%m%d-%H%M%S", time.gmtime(now) if self.utc else time.localtime(now))
+            if name == self._lastStamp:
+                self._stampCnt += 1
+                name = f"{name}-{self._stampCnt}"
+            else:
+                self._lastStamp = name
+                self._stampCnt = 0
+        return os.path.join(self.dirName, f"{self.logFileName}.{name}")
+
+    def add(self, pathName, keep):
+        """Add an archive and return the list of the oldest archives to remove, so that keep (if > 0) remain."""
+        archives = self.archives
+        archives.append(pathName)
+        expired = []
+        while 0 < keep < len(archives):
+            expired.append(archives.popleft())
+        return expired
+
+
+def UpdateSymlink(linkPathName, target):
+    """Atomically point the symbolic link linkPathName to target."""
+    if os.path.islink(linkPathName) and os.readlink(linkPathName) == target:
+        return
+    tmpPathName = linkPathName + ".tmp"
+    if os.path.lexists(tmpPathName):
+        os.remove(tmpPathName)
+    os.symlink(target, tmpPathName)
+    os.replace(tmpPathName, linkPathName)
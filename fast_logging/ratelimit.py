@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Martin Bammer. All Rights Reserved.
+# Licensed under MIT license.
+
+"""Rate limiting and sampling of log messages."""
+
+import random
+
+
+class RateLimiter(object):
+    """Token bucket rate limiting and sampling of log messages.
+
+    Messages are grouped by key, which is either the call site (code object and line number) or the
+    message template. A message is logged if the token bucket of its key contains a token (if rate > 0),
+    if it is the 1st of every sample messages (if sample > 1) and with the given probability (if < 1.0).
+    The number of suppressed messages per key is reported every reportInterval seconds.
+    """
+
+    def __init__(self, rate=0.0, burst=None, sample=1, probability=1.0, key="callsite", reportInterval=60.0,
+                 maxKeys=10000):
+        if key not in ("callsite", "template"):
+            raise ValueError("Invalid key")
+        if rate < 0.0 or sample < 1 or not 0.0 <= probability <= 1.0:
+            raise ValueError("Invalid rate, sample or probability")
+        self.rate = rate
+        self.burst = max(1.0, rate) if burst is None else burst
+        self.sample = sample
+        self.probability = probability
+        self.byCallsite = key == "callsite"
+        self.reportInterval = reportInterval
+        self.maxKeys = maxKeys
+        self.nextReport = float("inf")
+        self._keys = {}  # key -> [tokens, lastTime, count, suppressed, level, msg]
+        self._evicted = []  # (level, msg, suppressed) of removed keys, which are not reported yet
+
+    def allow(self, key, level, msg, now):
+        state = self._keys.get(key)
+        if state is None:
+            if len(self._keys) >= self.maxKeys:
+                # The suppressed counts of the removed keys are reported with the next message.
+                evicted = [(state[4], state[5], state[3]) for state in self._keys.values() if state[3]]
+                if evicted:
+                    self._evicted.extend(evicted)
+                    self.nextReport = now
+                self._keys.clear()
+            state = self._keys[key] = [self.burst, now, 0, 0, level, msg]
+        count = state[2]
+        state[2] = count + 1
+        if (self.sample > 1 and count % self.sample) or (self.probability < 1.0 and random.random() >= self.probability):
+            return self.__suppress(state, level, msg, now)
+        if self.rate > 0.0:
+            tokens = min(self.burst, state[0] + (now - state[1]) * self.rate)
+            state[1] = now
+            if tokens < 1.0:
+                state[0] = tokens
+                return self.__suppress(state, level, msg, now)
+            state[0] = tokens - 1.0
+        return True
+
+    def __suppress(self, state, level, msg, now):
+        if not state[3] and self.nextReport == float("inf"):
+            self.nextReport = now + self.reportInterval
+        state[3] += 1
+        state[4] = level
+        state[5] = msg
+        return False
+
+    def report(self):
+        """Return a list of (level, msg, suppressed) tuples for all keys with suppressed messages and reset them."""
+        self.nextReport = float("inf")
+        suppressed = self._evicted
+        self._evicted = []
+        for state in tuple(self._keys.values()):
+            if state[3]:
+                suppressed.append((state[4], state[5], state[3]))
+                state[3] = 0
+        return suppressed
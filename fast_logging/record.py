@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Martin Bammer. All Rights Reserved.
+# Licensed under MIT license.
+
+"""Log record."""
+
+
+class LogRecord(object):
+    """A single log message.
+
+    The message template is kept together with its arguments until the message is formatted by
+    getMessage. For callbacks written for the former (time, domain, level, msg, kwargs) tuples a record
+    can be unpacked and indexed like such a tuple.
+    """
+
+    __slots__ = ("time", "domain", "level", "msg", "args", "exc_info", "color", "console", "extra",
+                 "thread", "caller")
+
+    def __init__(self, time, domain, level, msg, args=None, exc_info=None, color=None, console=False, extra=None):
+        self.time = time
+        self.domain = domain
+        self.level = level
+        self.msg = msg
+        self.args = args
+        self.exc_info = exc_info
+        self.color = color
+        self.console = console
+        self.extra = extra
+        self.thread = None
+        self.caller = None
+
+    @classmethod
+    def fromKwargs(cls, time, domain, level, msg, kwargs):
+        if not kwargs:
+            return cls(time, domain, level, msg)
+        record = cls(time, domain, level, msg, None, kwargs.get("exc_info"), kwargs.get("color"),
+                     kwargs.get("console", False))
+        extra = {key: value for key, value in kwargs.items() if key not in KWARGS_FIELDS}
+        if extra:
+            record.extra = extra
+        record.thread = kwargs.get("thread")
+        record.caller = kwargs.get("caller")
+        return record
+
+    @classmethod
+    def fromEntry(cls, entry):
+        """Convert a (time, domain, level, msg, kwargs) tuple into a record."""
+        if entry.__class__ is cls:
+            return entry
+        return cls.fromKwargs(*entry)
+
+    def getMessage(self):
+        args = self.args
+        if args:
+            self.msg = self.msg % args
+            self.args = None
+        return self.msg
+
+    @property
+    def kwargs(self):
+        kwargs = {} if self.extra is None else dict(self.extra)
+        for name in KWARGS_FIELDS:
+            value = getattr(self, name)
+            if value is not None and value is not False:
+                kwargs[name] = value
+        return kwargs
+
+    def asTuple(self):
+        return self.time, self.domain, self.level, self.getMessage(), self.kwargs
+
+    def __len__(self):
+        return 5
+
+    def __iter__(self):
+        return iter(self.asTuple())
+
+    def __getitem__(self, index):
+        return self.asTuple()[index]
+
+    def __repr__(self):
+        return f"LogRecord{self.asTuple()!r}"
+
+
+# Keyword arguments of the former entry tuples which are fields of LogRecord.
+KWARGS_FIELDS = ("exc_info", "color", "console", "thread", "caller")
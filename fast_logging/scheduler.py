@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Martin Bammer. All Rights Reserved.
+# Licensed under MIT license.
+
+"""Shared scheduler for delayed logger callbacks."""
+
+import os
+import sys
+import time
+import heapq
+import traceback
+from itertools import count
+from threading import Thread, Condition
+
+
+class Scheduler(object):
+    """Run delayed callbacks of all loggers in a single daemon thread.
+
+    Pending callbacks are kept in a heap ordered by their due time. Cancelled entries are only marked
+    and dropped when they reach the top of the heap, so schedule and cancel cost O(log n) and O(1).
+    The thread is started with the first scheduled callback.
+    """
+
+    def __init__(self):
+        self.__reset()
+        if hasattr(os, "register_at_fork"):
+            # The thread doesn't exist in a forked child process, so the child starts with an empty heap.
+            os.register_at_fork(after_in_child=self.__reset)
+
+    def __reset(self):
+        self._heap = []
+        self._seq = count()
+        self._cond = Condition()
+        self._thread = None
+
+    def schedule(self, delay, func, *args):
+        """Call func(*args) after delay seconds. Returns an entry which can be passed to cancel."""
+        entry = [time.monotonic() + delay, next(self._seq), func, args]
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = Thread(target=self.__run, name="fastlogging-scheduler", daemon=True)
+                self._thread.start()
+            elif self._heap[0] is entry:
+                self._cond.notify()
+        return entry
+
+    @staticmethod
+    def cancel(entry):
+        entry[2] = None
+
+    def __run(self):
+        heap = self._heap
+        cond = self._cond
+        while True:
+            with cond:
+                while True:
+                    while heap and heap[0][2] is None:
+                        heapq.heappop(heap)
+                    if not heap:
+                        cond.wait()
+                        continue
+                    delay = heap[0][0] - time.monotonic()
+                    if delay <= 0.0:
+                        entry = heapq.heappop(heap)
+                        break
+                    cond.wait(delay)
+            func = entry[2]
+            if func is None:
+                continue
+            # noinspection PyBroadException
+            try:
+                func(*entry[3])
+            except:
+                print(traceback.format_exc(), file=sys.stderr)
+
+
+scheduler = Scheduler()
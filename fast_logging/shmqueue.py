@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Martin Bammer. All Rights Reserved.
+# Licensed under MIT license.
+
+"""Shared memory queue, which forwards log records of worker processes to a single writer process."""
+
+import sys
+import time
+import atexit
+import struct
+import traceback
+import multiprocessing
+from threading import Thread, Lock
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None  # Python < 3.8
+
+from fast_logging.record import LogRecord
+from fast_logging.scheduler import scheduler
+
+
+# The header is accessed as array of native 64 bit integers, so that head and tail are read and written
+# with single aligned memory accesses. head and tail are absolute byte positions in the record stream.
+CAPACITY, HEAD, TAIL, RECORDS, DROPPED, WAITS = range(6)
+HEADER_SIZE = 64
+# Payload length, time, level, length of the domain, length of exc_info. The payload is the domain,
+# the message and exc_info.
+FRAME = struct.Struct("<IdiHI")
+
+
+def _Attach(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    # Processes started by multiprocessing share the resource tracker of the writer process, so the
+    # block is not removed when a worker exits.
+    return shared_memory.SharedMemory(name)
+
+
+def _read(buf, capacity, pos, size):
+    offset = pos % capacity
+    first = capacity - offset
+    start = HEADER_SIZE + offset
+    if size <= first:
+        return bytes(buf[start:start + size])
+    return bytes(buf[start:start + first]) + bytes(buf[HEADER_SIZE:HEADER_SIZE + size - first])
+
+
+class ShmQueueProducer(object):
+    """Write log records into the ring buffer of a ShmQueueConsumer.
+
+    Instances are created with ShmQueueConsumer.producer and passed to the worker processes, which
+    install them with Logger.setQueue. Records are encoded into a local batch, which is copied into
+    the ring buffer with a single lock operation if it exceeds maxBytes, after interval seconds, by
+    flush and at exit. If the ring buffer is full and block is True, the batch waits until the
+    consumer made room for it (back-pressure). Batches which don't fit within timeout seconds
+    (None = wait forever) or if block is False are dropped and counted.
+    """
+
+    def __init__(self, name, lock, block=True, timeout=None, maxBytes=16384, interval=0.05, pollInterval=0.0005):
+        self.name = name
+        self.lock = lock
+        self.block = block
+        self.timeout = timeout
+        self.maxBytes = maxBytes
+        self.interval = interval
+        self.pollInterval = pollInterval
+        self.dropped = 0  # Records dropped by this producer
+        self.waits = 0    # Number of times this producer waited for free space
+        self._shm = None
+        self._buf = None
+        self._header = None
+        self._capacity = 0
+        self._maxPayload = 0
+        self._frames = []
+        self._size = 0
+        self._flushLock = Lock()
+        self._flushTimer = None
+        self._domains = {}   # domain -> encoded domain
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shm"] = state["_buf"] = state["_header"] = state["_flushLock"] = state["_flushTimer"] = None
+        state["_frames"] = []
+        state["_size"] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._flushLock = Lock()
+
+    def __attach(self):
+        # The shared memory block is attached in the worker process on first use.
+        self._shm = _Attach(self.name)
+        self._buf = self._shm.buf
+        self._header = self._buf[:HEADER_SIZE].cast("Q")
+        self._capacity = self._header[CAPACITY]
+        self._maxPayload = self._capacity // 4 - FRAME.size
+        self.maxBytes = min(self.maxBytes, self._capacity // 4)
+        atexit.register(self.close)
+
+    def put(self, logTime, domain, level, msg, excInfo=None):
+        """Queue a record."""
+        if self._shm is None:
+            self.__attach()
+        domainBytes = self._domains.get(domain)
+        if domainBytes is None:
+            domainBytes = self._domains[domain] = domain.encode("utf-8", "backslashreplace")
+        msg = msg.encode("utf-8", "backslashreplace")
+        if excInfo:
+            excInfo = str(excInfo).encode("utf-8", "backslashreplace")
+            excLen = len(excInfo)
+        else:
+            excLen = 0
+        length = len(domainBytes) + len(msg) + excLen
+        if length > self._maxPayload:
+            # Truncate too big records, so that they can't block the ring buffer.
+            msg = msg[:max(0, self._maxPayload - len(domainBytes) - excLen)]
+            if excLen:
+                excInfo = excInfo[:self._maxPayload - len(domainBytes) - len(msg)]
+                excLen = len(excInfo)
+            length = len(domainBytes) + len(msg) + excLen
+        frame = FRAME.pack(length, logTime, level, len(domainBytes), excLen) + domainBytes + msg
+        if excLen:
+            frame += excInfo
+        # list.append is atomic, so no lock is needed. size is only a threshold for flushing.
+        self._frames.append(frame)
+        self._size += len(frame)
+        if self._size >= self.maxBytes:
+            self.flush()
+        elif self._flushTimer is None and self.interval is not None:
+            self._flushTimer = scheduler.schedule(self.interval, self.__flushTimeout)
+
+    def putMany(self, records):
+        """Queue a list of LogRecord instances."""
+        for record in records:
+            self.put(record.time, record.domain, record.level, record.getMessage(), record.exc_info)
+
+    def __flushTimeout(self):
+        self._flushTimer = None
+        self.flush()
+
+    def flush(self):
+        """Copy the batch into the ring buffer. Returns False if it was dropped."""
+        with self._flushLock:
+            return self.__flush()
+
+    def __flush(self):
+        frames = self._frames
+        cnt = len(frames)
+        if not cnt or self._shm is None:
+            return True
+        # A thread could append to the batch meanwhile, so only the joined frames are removed.
+        data = b"".join(frames[:cnt])
+        del frames[:cnt]
+        self._size = 0
+        return self.__write(data, cnt)
+
+    def __write(self, data, cnt):
+        size = len(data)
+        buf = self._buf
+        header = self._header
+        capacity = self._capacity
+        deadline = None
+        while True:
+            with self.lock:
+                head = header[HEAD]
+                if head + size - header[TAIL] <= capacity:
+                    offset = head % capacity
+                    first = capacity - offset
+                    start = HEADER_SIZE + offset
+                    if size <= first:
+                        buf[start:start + size] = data
+                    else:
+                        buf[start:start + first] = data[:first]
+                        buf[HEADER_SIZE:HEADER_SIZE + size - first] = data[first:]
+                    # The head is published after the records were copied.
+                    header[HEAD] = head + size
+                    header[RECORDS] += cnt
+                    return True
+                if not self.block or (deadline is not None and time.monotonic() >= deadline):
+                    header[DROPPED] += cnt
+                    self.dropped += cnt
+                    return False
+                if deadline is None:
+                    header[WAITS] += 1
+                    self.waits += 1
+                    deadline = float("inf") if self.timeout is None else time.monotonic() + self.timeout
+            time.sleep(self.pollInterval)
+
+    def close(self):
+        with self._flushLock:
+            if self._shm is None:
+                return
+            self.__flush()
+            if self._flushTimer is not None:
+                scheduler.cancel(self._flushTimer)
+                self._flushTimer = None
+            self._header.release()
+            self._header = self._buf = None
+            self._shm.close()
+            self._shm = None
+
+
+class ShmQueueConsumer(object):
+    """Read log records from a shared memory ring buffer and write them with logger.
+
+    The ring buffer holds length prefixed records. Producers serialize their writes with a
+    multiprocessing lock and publish the head after a batch was copied. The single consumer thread
+    only moves the tail, so it never takes the lock. It polls the head every pollInterval seconds
+    while the ring buffer is empty and passes all available records to logger.logMany at once.
+    mpContext is the multiprocessing context of the worker processes (default: the default context).
+    """
+
+    def __init__(self, logger, size=4 * 1024 * 1024, pollInterval=0.001, mpContext=None):
+        if shared_memory is None:
+            raise RuntimeError("ShmQueueConsumer needs Python >= 3.8 (multiprocessing.shared_memory)")
+        self.logger = logger
+        self.pollInterval = pollInterval
+        self.lock = (multiprocessing if mpContext is None else mpContext).Lock()
+        self.shm = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + size)
+        self.name = self.shm.name
+        self.capacity = size
+        self._header = self.shm.buf[:HEADER_SIZE].cast("Q")
+        self._header[CAPACITY] = size
+        self._tail = 0
+        self._running = True
+        self._thread = Thread(target=self.__run, name="ShmQueueConsumer", daemon=True)
+        self._thread.start()
+
+    def producer(self, block=True, timeout=None, maxBytes=16384, interval=0.05):
+        return ShmQueueProducer(self.name, self.lock, block, timeout, maxBytes, interval)
+
+    def __run(self):
+        buf = self.shm.buf
+        header = self._header
+        capacity = self.capacity
+        sleep = time.sleep
+        logMany = self.logger.logMany
+        while True:
+            head = header[HEAD]
+            tail = self._tail
+            if head == tail:
+                if not self._running:
+                    break
+                sleep(self.pollInterval)
+                continue
+            data = _read(buf, capacity, tail, head - tail)
+            # Free the space before the records are written.
+            self._tail = header[TAIL] = head
+            records = []
+            pos = 0
+            end = len(data)
+            while pos < end:
+                length, logTime, level, domainLen, excLen = FRAME.unpack_from(data, pos)
+                pos += FRAME.size
+                msgEnd = pos + length - excLen
+                records.append(LogRecord(logTime, data[pos:pos + domainLen].decode("utf-8", "replace"), level,
+                                         data[pos + domainLen:msgEnd].decode("utf-8", "replace"), None,
+                                         data[msgEnd:pos + length].decode("utf-8", "replace") if excLen else None))
+                pos += length
+            # noinspection PyBroadException
+            try:
+                logMany(records)
+            except:
+                print(traceback.format_exc(), file=sys.stderr)
+
+    def stats(self):
+        if self.shm is None:
+            return self._stats
+        header = self._header
+        return {"capacity": header[CAPACITY], "used": header[HEAD] - header[TAIL], "records": header[RECORDS],
+                "dropped": header[DROPPED], "waits": header[WAITS]}
+
+    def stop(self):
+        """Write the remaining records and remove the shared memory block. Call it before logger is stopped."""
+        if self.shm is None:
+            return
+        self._running = False
+        self._thread.join()
+        # The final counters are kept.
+        self._stats = self.stats()
+        self._header.release()
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
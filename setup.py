@@ -67,6 +67,17 @@ else:
             build_ext.run(self)
             shutil.copyfile(PKGNAME + "/__init__.py", self.build_lib + "/" + PKGNAME + "/__init__.py")
             shutil.copyfile(PKGNAME + "/console.py", self.build_lib + "/" + PKGNAME + "/console.py")
+            shutil.copyfile(PKGNAME + "/formatter.py", self.build_lib + "/" + PKGNAME + "/formatter.py")
+            shutil.copyfile(PKGNAME + "/record.py", self.build_lib + "/" + PKGNAME + "/record.py")
+            shutil.copyfile(PKGNAME + "/ratelimit.py", self.build_lib + "/" + PKGNAME + "/ratelimit.py")
+            shutil.copyfile(PKGNAME + "/scheduler.py", self.build_lib + "/" + PKGNAME + "/scheduler.py")
+            shutil.copyfile(PKGNAME + "/backlog.py", self.build_lib + "/" + PKGNAME + "/backlog.py")
+            shutil.copyfile(PKGNAME + "/flightrec.py", self.build_lib + "/" + PKGNAME + "/flightrec.py")
+            shutil.copyfile(PKGNAME + "/flightrecdump.py", self.build_lib + "/" + PKGNAME + "/flightrecdump.py")
+            shutil.copyfile(PKGNAME + "/policy.py", self.build_lib + "/" + PKGNAME + "/policy.py")
+            shutil.copyfile(PKGNAME + "/compress.py", self.build_lib + "/" + PKGNAME + "/compress.py")
+            shutil.copyfile(PKGNAME + "/mmapwriter.py", self.build_lib + "/" + PKGNAME + "/mmapwriter.py")
+            shutil.copyfile(PKGNAME + "/shmqueue.py", self.build_lib + "/" + PKGNAME + "/shmqueue.py")
             shutil.copyfile(PKGNAME + "/optimize.py", self.build_lib + "/" + PKGNAME + "/optimize.py")
 
         def build_extensions(self):
@@ -0,0 +1,46 @@
+import os
+import signal
+import subprocess
+import sys
+
+from fast_logging import Logger, LogInit, GetLogger, FlightRecorder, ReadFlightRecorder, DEBUG, INFO, WARNING
+
+
+def test_flight_recorder(tmp_path):
+    pathName = str(tmp_path / "test_flight_recorder.ring")
+    recorder = FlightRecorder(pathName, 1024)
+    logger = LogInit(level=INFO)
+    child = GetLogger("root.child", WARNING)
+    Logger.setFlightRecorder(recorder)
+    try:
+        assert not logger.debugEnabled
+        for i in range(100):
+            logger.debug("debug %d", i)
+            logger.info("info %d", i)
+        child.debug("child")
+    finally:
+        Logger.setFlightRecorder(None)
+        child.shutdown()
+        logger.shutdown()
+    records = recorder.records()
+    recorder.close()
+    assert [record.msg for record in ReadFlightRecorder(pathName)] == [record.msg for record in records]
+    assert 10 < len(records) < 100
+    assert [record.msg for record in records[-3:]] == ["debug 99", "info 99", "child"]
+    assert [record.level for record in records[-3:]] == [DEBUG, INFO, DEBUG]
+
+
+def test_flight_recorder_sigkill(tmp_path):
+    pathName = str(tmp_path / "test_flight_recorder_sigkill.ring")
+    code = f"""if True:
+        import os, signal
+        from fast_logging import Logger, LogInit, FlightRecorder, INFO
+        Logger.setFlightRecorder(FlightRecorder({pathName!r}, 65536))
+        logger = LogInit(level=INFO, pathName={str(tmp_path / "x.log")!r}, useThreads=True)
+        for i in range(10):
+            logger.info("message %d", i)
+        os.kill(os.getpid(), signal.SIGKILL)
+        """
+    proc = subprocess.run([sys.executable, "-c", code], env=dict(os.environ, PYTHONPATH=os.getcwd()))
+    assert proc.returncode == -signal.SIGKILL
+    assert [record.msg for record in ReadFlightRecorder(pathName)] == [f"message {i}" for i in range(10)]
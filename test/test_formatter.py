@@ -0,0 +1,54 @@
+import time
+
+import pytest
+
+from fast_logging import LogInit, TimeFormatter, Lazy, LOG2SYM, LOG2SSYM, INFO, ERROR
+from fast_logging.formatter import CompileLayout
+from fast_logging.record import LogRecord
+
+
+def test_time_formatter():
+    logTime = time.time()
+    for dateFmt in ("%y.%m.%d %H:%M:%S", "%Y-%m-%d %H:%M:%S %%"):
+        assert TimeFormatter(dateFmt).format(logTime) == time.strftime(dateFmt, time.localtime(logTime))
+        assert TimeFormatter(dateFmt, True).format(logTime) == time.strftime(dateFmt, time.gmtime(logTime))
+
+
+def test_time_formatter_subsec():
+    formatter = TimeFormatter("%H:%M:%S.%3f|%f")
+    sTime = time.strftime("%H:%M:%S", time.localtime(1000.0))
+    assert formatter.format(1000.25) == sTime + ".250|250000"
+    assert formatter.format(1000.000125) == sTime + ".000|000125"
+
+
+def test_compile_layout():
+    fmtTime = TimeFormatter("%H:%M:%S").format
+    sTime = fmtTime(1000.0)
+    fmtMessage = CompileLayout("{time}: {domain}: {level}: {message}", "root", fmtTime, LOG2SYM, LOG2SSYM)
+    assert fmtMessage(LogRecord(1000.0, "root", INFO, "msg"), "msg") == f"{sTime}: root: INFO   : msg"
+    fmtMessage = CompileLayout("[{lvl!r:>6}] {{{domain}}} {message} {extras} {extra.user}", "db", fmtTime,
+                               LOG2SYM, LOG2SSYM)
+    record = LogRecord(1000.0, "db", ERROR, "msg", extra={"user": "bob"})
+    assert fmtMessage(record, "msg") == "[ 'ERR'] {db} msg user=bob bob"
+    fmtMessage = CompileLayout('{message:"<6}|{time:>10}', "root", fmtTime, LOG2SYM, LOG2SSYM)
+    assert fmtMessage(record, "msg") == "msg" + '"' * 3 + "|" + f"{sTime:>10}"
+    for layout in ("{message:{w}}", "{message!x}"):
+        with pytest.raises(ValueError):
+            CompileLayout(layout, "root", fmtTime, LOG2SYM, LOG2SSYM)
+
+
+def test_lazy(tmp_path):
+    calls = []
+
+    def Expensive(value):
+        calls.append(value)
+        return value * 2
+
+    pathName = str(tmp_path / "test_lazy.log")
+    logger = LogInit(level=INFO, pathName=pathName)
+    logger.debug("debug %s", Lazy(Expensive, 1))
+    logger.info("info %d %s", Lazy(Expensive, 2), Lazy(Expensive, 3))
+    logger.shutdown()
+    assert calls == [2, 3]
+    with open(pathName) as F:
+        assert F.read().endswith("info 4 6\n")
@@ -0,0 +1,261 @@
+import os
+import time
+
+import pytest
+
+from fast_logging import Logger, LogInit, GetLogger, Remove, ParseLevels, Indent, LogRecord, RateLimiter, FlushPolicy, \
+    NOTSET, DEBUG, INFO, WARNING, ERROR
+from fast_logging.backlog import Backlog, RECORD_OVERHEAD
+
+
+def test_set_level():
+    logger = LogInit(level=INFO)
+    assert not logger.debugEnabled and logger.infoEnabled
+    assert "debug" in logger.__dict__ and "info" not in logger.__dict__
+    logger.debug("disabled %d", 1)
+    logger.setLevel(ERROR)
+    assert logger.level == ERROR and not logger.isEnabledFor(INFO)
+    assert "info" in logger.__dict__ and "error" not in logger.__dict__
+    logger.level = DEBUG
+    assert logger.debugEnabled and "debug" not in logger.__dict__
+    logger.shutdown()
+
+
+def test_domain_hierarchy(tmp_path):
+    pathName = str(tmp_path / "test_hierarchy.log")
+    app = LogInit("app", INFO, pathName=pathName)
+    pool = GetLogger("app.db.pool")
+    assert pool.parent is app and pool.level == INFO
+    db = GetLogger("app.db", ERROR)
+    assert pool.parent is db and db.parent is app and pool.level == ERROR
+    db.setLevel(DEBUG)
+    assert pool.debugEnabled
+    db.setLevel(NOTSET)
+    assert pool.level == INFO
+    pool.info("pool message")
+    Remove("app.db")
+    assert pool.parent is app
+    app.shutdown()
+    pool.shutdown()
+    with open(pathName) as F:
+        assert F.read().endswith(": app.db.pool: INFO   : pool message\n")
+
+
+def test_parse_levels():
+    assert ParseLevels("app=INFO, app.db=debug,x=5") == {"app": INFO, "app.db": DEBUG, "x": 5}
+
+
+def test_indent_context(tmp_path):
+    pathName = str(tmp_path / "test_indent.log")
+    logger = LogInit(pathName=pathName, useThreads=True, indent=(0, 2, 4, True))
+
+    @Indent()
+    def Nested(depth):
+        logger.info("depth %d", depth)
+        if depth < 3:
+            Nested(depth + 1)
+
+    Nested(1)
+    logger.shutdown()
+    with open(pathName) as F:
+        messages = [line.split(": ", 3)[3] for line in F.read().splitlines()]
+    assert messages == ["  depth 1", "    depth 2", "    depth 3"]
+
+
+def test_log_kwargs():
+    logger = LogInit(backlog=10)
+    logger.info("login %s", "ok", user="bob", extra={"ip": "::1"})
+    logger.error("denied", user="eve")
+    logger.log(WARNING, "plain")
+    records = Logger.backlog.query()
+    assert [record.extra for record in records] == [{"ip": "::1", "user": "bob"}, {"user": "eve"}, None]
+    # Same result as for the keyword arguments of logEntry.
+    logger.logEntry(time.time(), "root", ERROR, "denied", {"user": "eve", "console": False})
+    assert Logger.backlog.query()[-1].extra == {"user": "eve"}
+    Logger.setBacklog(0)
+    logger.shutdown()
+
+
+def test_log_many(tmp_path):
+    for useThreads in (False, True):
+        pathName = str(tmp_path / f"test_log_many_{useThreads}.log")
+        logger = LogInit(level=INFO, pathName=pathName, useThreads=useThreads)
+        logger.logMany([(INFO, "message %d", (1,)), (DEBUG, "filtered", None),
+                        LogRecord(0.0, "other", ERROR, "record %s", ("x",))])
+        logger.shutdown()
+        with open(pathName) as F:
+            lines = F.read().splitlines()
+        assert len(lines) == 2
+        assert lines[0].endswith(": root: INFO   : message 1")
+        assert lines[1].endswith(": other: ERROR  : record x")
+
+
+def test_shared_path(tmp_path):
+    for useThreads in (False, True):
+        pathName = str(tmp_path / f"test_shared_path_{useThreads}.log")
+        first = LogInit("first", pathName=pathName, maxSize=300, backupCnt=10, useThreads=useThreads)
+        second = GetLogger("second", pathName=pathName)
+        assert first._sink is second._sink and first._sink.refCnt == 2
+        assert GetLogger("third", pathName=pathName, maxSize=300, backupCnt=10)._sink is first._sink
+        Remove("third")
+        with pytest.raises(ValueError):
+            GetLogger("third", pathName=pathName, maxSize=1000, backupCnt=10)
+        for i in range(5):
+            first.info("first %d", i)
+            second.info("second %d", i)
+        first.shutdown()
+        second.info("after first")
+        second.shutdown()
+        # Both domains are written and rotated together. Oldest backup first.
+        fileNames = sorted((fileName for fileName in os.listdir(tmp_path)
+                            if fileName.startswith(f"test_shared_path_{useThreads}.log")), reverse=True)
+        assert len(fileNames) > 1
+        lines = []
+        for fileName in fileNames:
+            with open(tmp_path / fileName) as F:
+                lines.extend(line.split(": ", 1)[1] for line in F.read().splitlines())
+        assert lines == [f"{name}: INFO   : {name} {i}" for i in range(5) for name in ("first", "second")] + \
+            ["second: INFO   : after first"]
+
+
+def test_rate_limit(tmp_path):
+    pathName = str(tmp_path / "test_rate_limit.log")
+    logger = LogInit(pathName=pathName)
+    logger.setRateLimit(RateLimiter(rate=0.001, burst=2))
+    for i in range(10):
+        logger.warning("flood %d", i)
+    logger.setRateLimit(RateLimiter(sample=3, key="template"))
+    for i in range(6):
+        logger.info("sampled %d", i)
+    logger.setRateLimit(RateLimiter(rate=0.001, key="template", reportInterval=0.1, maxKeys=1))
+    for i in range(3):
+        logger.info("idle")
+    # Reported by the scheduler while the logger is idle.
+    time.sleep(0.3)
+    logger.flush()
+    with open(pathName) as F:
+        assert F.read().splitlines()[-1].endswith(": Suppressed 2 messages like: idle")
+    for i in range(2):
+        logger.info("evicted")
+    # The suppressed count of the evicted key is kept.
+    logger.info("other")
+    logger.shutdown()
+    with open(pathName) as F:
+        messages = [line.split(": ", 3)[3] for line in F.read().splitlines()]
+    assert messages == ["flood 0", "flood 1", "Suppressed 8 messages like: flood %d", "sampled 0", "sampled 3",
+                        "Suppressed 4 messages like: sampled %d", "idle", "Suppressed 2 messages like: idle",
+                        "evicted", "other", "Suppressed 1 messages like: evicted"]
+
+
+def test_same_msg_timeout(tmp_path):
+    pathName = str(tmp_path / "test_same_msg_timeout.log")
+    logger = LogInit(pathName=pathName)
+    Logger.sameMsgCountMax = 100
+    Logger.sameMsgTimeout = 0.05
+    try:
+        for _ in range(3):
+            logger.info("same")
+        time.sleep(0.3)
+        logger.info("other")
+    finally:
+        logger.shutdown()
+        Logger.sameMsgCountMax = 0
+        Logger.sameMsgTimeout = 30.0
+    with open(pathName) as F:
+        lines = F.read().splitlines()
+    assert len(lines) == 3
+    assert lines[0].endswith(": same") and lines[2].endswith(": other")
+    assert lines[1].startswith("3 times: ") and lines[1].endswith(": same")
+
+
+def test_dedup_window(tmp_path):
+    pathName = str(tmp_path / "test_dedup_window.log")
+    logger = LogInit(pathName=pathName)
+    Logger.dedupWindow = 60.0
+    try:
+        for i in range(3):
+            logger.info("a %d", i)
+            logger.info("b")
+        logger.info("b")
+    finally:
+        logger.shutdown()
+        Logger.dedupWindow = 0.0
+    with open(pathName) as F:
+        messages = [line.split(": ", 3)[3] for line in F.read().splitlines()]
+    assert messages == ["a 0", "b", "2 times: a 2", "3 times: b"]
+
+
+def test_backlog_query():
+    logger = LogInit(backlog=4)
+    db = GetLogger("db")
+    logger.info("start")
+    db.error("connection failed")
+    logger.warning("slow")
+    db.debug("query")
+    logger.error("retry failed")
+    backlog = Logger.backlog
+    assert len(backlog) == 4 and [record.msg for record in backlog][0] == "connection failed"
+    assert [record.msg for record in backlog.query(level=WARNING)] == ["connection failed", "slow", "retry failed"]
+    assert [record.msg for record in backlog.query(domain="db", level=ERROR)] == ["connection failed"]
+    assert [record.msg for record in backlog.query(contains="failed", limit=1)] == ["retry failed"]
+    Logger.setBacklog(0, 2 * (RECORD_OVERHEAD + 12))
+    assert [record.msg for record in Logger.backlog] == ["query", "retry failed"]
+    # Tracebacks are counted too.
+    Logger.backlog.append(LogRecord(0.0, "db", ERROR, "failed", exc_info="x" * 100))
+    assert [record.msg for record in Logger.backlog] == ["failed"]
+    Logger.setBacklog(0)
+    Remove("db")
+    logger.shutdown()
+
+
+def test_backlog_query_unordered():
+    # Two overlapping batches, e.g. from different processes. So the arrival order isn't the time order.
+    records = [LogRecord(100.0 + i, "a", WARNING, f"A{i}") for i in range(5)] + \
+        [LogRecord(101.0 + i, "b", ERROR, f"B{i}") for i in range(3)]
+    backlog = Backlog(records=records)
+    assert [record.msg for record in backlog.query(since=102.0)] == ["A2", "A3", "A4", "B1", "B2"]
+    assert [record.msg for record in backlog.query(level=WARNING)] == [record.msg for record in records]
+    assert [record.msg for record in backlog.query(level=WARNING, since=103.0, limit=2)] == ["A4", "B2"]
+
+
+def test_flush_policy(tmp_path):
+    pathName = str(tmp_path / "test_flush_policy.log")
+    logger = LogInit(pathName=pathName, maxSize=1000000, backupCnt=1)
+    logger.setFlushPolicy(FlushPolicy(interval=0.05, level=ERROR, sync="fdatasync"))
+    try:
+        logger.info("buffered")
+        assert os.path.getsize(pathName) == 0
+        logger.error("written")
+        assert os.path.getsize(pathName) > 0
+        logger.info("interval")
+        size = os.path.getsize(pathName)
+        time.sleep(0.3)
+        assert os.path.getsize(pathName) > size
+        size = os.path.getsize(pathName)
+        logger.logMany([(INFO, "batch", None), (ERROR, "batch error", None)])
+        assert os.path.getsize(pathName) > size
+    finally:
+        logger.shutdown()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="Needs os.fork")
+def test_fork(tmp_path):
+    for useThreads in (False, True):
+        pathName = str(tmp_path / f"test_fork_{useThreads}.log")
+        logger = LogInit(pathName=pathName, useThreads=useThreads)
+        logger.setFlushPolicy(FlushPolicy(interval=0.05))
+        try:
+            logger.info("parent")
+            pid = os.fork()
+            if pid == 0:
+                # The interval flush works in the child and the buffered parent message isn't written twice.
+                logger.info("child")
+                time.sleep(0.3)
+                consoleOk = not useThreads or Logger.thrConsoleLogger.is_alive()
+                with open(pathName) as F:
+                    os._exit(0 if F.read().count(": child\n") == 1 and consoleOk else 1)
+            assert os.waitpid(pid, 0)[1] == 0
+        finally:
+            logger.shutdown()
+        with open(pathName) as F:
+            assert sorted(line.split(": ", 3)[3] for line in F.read().splitlines()) == ["child", "parent"]
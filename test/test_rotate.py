@@ -1,7 +1,15 @@
 
 import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import zlib
 
-from fast_logging import LogInit
+import pytest
+
+from fast_logging import Logger, LogInit, CompressPool, RotatePolicy, FlushPolicy, MmapWriter
 
 
 def RemoveLogs():
@@ -24,3 +32,242 @@ def test_rotate():
     assert os.path.exists("test_rotate.log.1")
     assert os.path.getsize("test_rotate.log.1") == 81942
     RemoveLogs()
+
+
+def test_rotate_non_ascii(tmp_path):
+    pathName = str(tmp_path / "test_rotate_non_ascii.log")
+    logger = LogInit(pathName=pathName, console=False, maxSize=4096, backupCnt=2)
+    for i in range(100):
+        logger.error("Größe überschritten: %d", i)
+    logger.stop()
+    with open(pathName + ".1", "rb") as F:
+        data = F.read()
+    lineSize = len(data.splitlines(True)[-1])
+    assert 4096 <= len(data) < 4096 + lineSize
+    assert data.decode("utf-8").count("\n") == len(data.splitlines())
+
+
+def test_rotate_compress(tmp_path):
+    pathName = str(tmp_path / "test_rotate_compress.log")
+    jobs = []
+    Logger.compressPool = CompressPool(callback=lambda *args: jobs.append(args))
+    logger = LogInit(pathName=pathName, console=False, maxSize=4096, backupCnt=3, compress=(zlib, ".z"))
+    try:
+        for i in range(500):
+            logger.error("printing line: %d", i)
+    finally:
+        logger.shutdown()
+        Logger.compressPool.shutdown()
+        Logger.compressPool = None
+        Logger.compress = None
+    assert sorted(os.listdir(tmp_path)) == ["test_rotate_compress.log", "test_rotate_compress.log.1.z",
+                                            "test_rotate_compress.log.2.z", "test_rotate_compress.log.3.z"]
+    with open(pathName + ".1.z", "rb") as F:
+        lines = zlib.decompress(F.read()).decode("utf-8").splitlines()
+    with open(pathName) as F:
+        assert int(lines[-1].rsplit(" ", 1)[1]) + 1 == int(F.readline().rsplit(" ", 1)[1])
+    assert len(jobs) >= 3 and all(error is None and bytesIn > bytesOut > 0
+                                  for _, _, bytesIn, bytesOut, _, error in jobs)
+
+
+class SlowCompressor(object):
+
+    @staticmethod
+    def compress(data):
+        time.sleep(0.2)
+        return zlib.compress(data)
+
+
+def test_rotate_compress_nowait(tmp_path):
+    pathName = str(tmp_path / "test_rotate_compress_nowait.log")
+    logger = LogInit(pathName=pathName, console=False, maxSize=1024, backupCnt=3, compress=(SlowCompressor, ".z"))
+    try:
+        t1 = time.time()
+        for i in range(200):
+            logger.error("printing line: %d", i)
+        assert time.time() - t1 < 0.2
+    finally:
+        logger.shutdown()
+        Logger.compressPool.shutdown()
+        Logger.compressPool = None
+        Logger.compress = None
+    assert sorted(os.listdir(tmp_path)) == ["test_rotate_compress_nowait.log", "test_rotate_compress_nowait.log.1.z",
+                                            "test_rotate_compress_nowait.log.2.z", "test_rotate_compress_nowait.log.3.z"]
+    with open(pathName + ".1.z", "rb") as F:
+        lines = zlib.decompress(F.read()).decode("utf-8").splitlines()
+    with open(pathName) as F:
+        assert int(lines[-1].rsplit(" ", 1)[1]) + len(F.read().splitlines()) == 199
+
+
+def test_rotate_time(tmp_path):
+    pathName = str(tmp_path / "test_rotate_time.log")
+    linkPathName = str(tmp_path / "current.log")
+    logger = LogInit(pathName=pathName, console=False, backupCnt=5)
+    logger.setRotatePolicy(RotatePolicy(when=0.2, symlink=linkPathName))
+    try:
+        logger.info("first")
+        logger.flush()
+        time.sleep(0.5)
+        assert os.path.exists(pathName + ".1")
+        logger.info("second")
+    finally:
+        logger.shutdown()
+    assert os.path.realpath(linkPathName) == os.path.realpath(pathName)
+    with open(pathName + ".1") as F:
+        assert F.read().endswith(": first\n")
+    with open(pathName) as F:
+        assert F.read().endswith(": second\n")
+    assert RotatePolicy(when="daily", utc=True).nextRotation(86400 * 3 + 5) == 86400 * 4
+
+
+def test_rotate_default_policy(tmp_path):
+    pathName = str(tmp_path / "test_rotate_default_policy.log")
+    Logger.rotatePolicy = RotatePolicy(maxSize=200)
+    try:
+        logger = LogInit(pathName=pathName, console=False, backupCnt=5)
+        for i in range(10):
+            logger.info("message %d", i)
+        logger.shutdown()
+    finally:
+        Logger.rotatePolicy = None
+    assert os.path.exists(pathName + ".1")
+
+
+def test_rotate_archive(tmp_path, monkeypatch):
+    pathName = str(tmp_path / "test_rotate_archive.log")
+    listdir = os.listdir
+    listdirCalls = []
+    monkeypatch.setattr(os, "listdir", lambda *args: listdirCalls.append(args) or listdir(*args))
+    for _ in range(2):
+        logger = LogInit(pathName=pathName, console=False, maxSize=1024, backupCnt=3)
+        logger.setRotatePolicy(RotatePolicy(archive="seq"))
+        for i in range(100):
+            logger.error("printing line: %d", i)
+        logger.shutdown()
+    assert len(listdirCalls) == 2
+    archives = sorted(fileName for fileName in listdir(tmp_path) if fileName != "test_rotate_archive.log")
+    assert len(archives) == 3 and int(archives[-1].rsplit(".", 1)[1]) > 6
+
+
+def test_rotate_archive_compress(tmp_path):
+    pathName = str(tmp_path / "test_rotate_archive_compress.log")
+    logger = LogInit(pathName=pathName, console=False, maxSize=2000, backupCnt=2, compress=(zlib, ".z"))
+    logger.setRotatePolicy(RotatePolicy(archive="seq"))
+    try:
+        for i in range(5000):
+            logger.error("printing line: %d", i)
+    finally:
+        logger.shutdown()
+        Logger.compressPool.shutdown()
+        Logger.compressPool = None
+        Logger.compress = None
+    archives = sorted(fileName for fileName in os.listdir(tmp_path) if fileName != "test_rotate_archive_compress.log")
+    assert len(archives) == 2 and all(fileName.endswith(".z") for fileName in archives)
+
+
+def test_rotate_preopen(tmp_path):
+    pathName = str(tmp_path / "test_rotate_preopen.log")
+    logger = LogInit(pathName=pathName, console=False, maxSize=1024, backupCnt=1000)
+    logger.setRotatePolicy(RotatePolicy(archive="seq", preopen=True))
+    for i in range(500):
+        logger.error("printing line: %d", i)
+    assert os.path.exists(pathName + ".next")
+    logger.shutdown()
+    assert not os.path.exists(pathName + ".next")
+    lines = []
+    for fileName in os.listdir(tmp_path):
+        with open(tmp_path / fileName) as F:
+            lines.extend(F.read().splitlines())
+    assert len(lines) == 500 and len(os.listdir(tmp_path)) > 10
+
+
+def test_rotate_preopen_leftover(tmp_path):
+    pathName = str(tmp_path / "test_rotate_preopen_leftover.log")
+    with open(pathName + ".next", "w") as F:
+        F.write("left over\n")
+    logger = LogInit(pathName=pathName, console=False, maxSize=1024, backupCnt=1000)
+    logger.setRotatePolicy(RotatePolicy(archive="seq", preopen=True))
+    for i in range(100):
+        logger.error("printing line: %d", i)
+    logger.shutdown()
+    fileNames = os.listdir(tmp_path)
+    contents = []
+    for fileName in fileNames:
+        with open(tmp_path / fileName) as F:
+            contents.append(F.read())
+    assert "left over\n" in contents and sum(content.count("\n") for content in contents) == 101
+    assert all(re.fullmatch(r"test_rotate_preopen_leftover\.log(\.\d{6})?", fileName) for fileName in fileNames)
+
+
+def test_rotate_shared(tmp_path):
+    pathName = str(tmp_path / "test_rotate_shared.log")
+    code = f"""if True:
+        import sys
+        from fast_logging import LogInit, RotatePolicy
+        logger = LogInit(pathName={pathName!r}, console=False, maxSize=8192, backupCnt=1000)
+        logger.setRotatePolicy(RotatePolicy(archive="seq", shared=True, checkBytes=1024))
+        for i in range(2000):
+            logger.info("process %s line %d", sys.argv[1], i)
+        logger.shutdown()
+        """
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    procs = [subprocess.Popen([sys.executable, "-c", code, str(n)], env=env) for n in range(4)]
+    assert all(proc.wait() == 0 for proc in procs)
+    fileNames = [fileName for fileName in os.listdir(tmp_path) if not fileName.endswith(".lock")]
+    lines = []
+    for fileName in fileNames:
+        with open(tmp_path / fileName) as F:
+            lines.extend(F.read().splitlines())
+    regex = re.compile(r".*: root: INFO +: process (\d) line (\d+)")
+    assert sorted(regex.fullmatch(line).groups() for line in lines) == \
+        sorted((str(n), str(i)) for n in range(4) for i in range(2000))
+    # Each rotated file is close to maxSize, so the processes did not rotate independently.
+    assert len(fileNames) < 2 * 4 * 2000 * len(lines[0]) / 8192
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="Needs os.fork")
+def test_rotate_shared_fork(tmp_path):
+    import fcntl
+    pathName = str(tmp_path / "test_rotate_shared_fork.log")
+    logger = LogInit(pathName=pathName, console=False, maxSize=1024, backupCnt=1000)
+    logger.setRotatePolicy(RotatePolicy(archive="seq", shared=True, checkBytes=256))
+    try:
+        logger.rotate()
+        lockFd = logger._sink._lockFd
+        fcntl.flock(lockFd, fcntl.LOCK_EX)
+        pid = os.fork()
+        if pid == 0:
+            # The rotation in the child waits for the lock of the parent.
+            thread = threading.Thread(target=logger.rotate, daemon=True)
+            thread.start()
+            thread.join(0.3)
+            os._exit(0 if thread.is_alive() else 1)
+        assert os.waitpid(pid, 0)[1] == 0
+        fcntl.flock(lockFd, fcntl.LOCK_UN)
+    finally:
+        logger.shutdown()
+
+
+def test_rotate_mmap(tmp_path):
+    pathName = str(tmp_path / "test_rotate_mmap.log")
+    # A crashed writer leaves the unused preallocated space filled with NUL bytes.
+    fd = os.open(pathName, os.O_RDWR | os.O_CREAT)
+    MmapWriter(fd, 65536).write(b"before crash\n")
+    os.close(fd)
+    assert os.path.getsize(pathName) == 65536
+    logger = LogInit(pathName=pathName, console=False, maxSize=4096, backupCnt=100)
+    logger.setFlushPolicy(FlushPolicy(mmapSegment=65536))
+    for i in range(500):
+        logger.error("printing line: %d", i)
+    logger.shutdown()
+    fileNames = sorted(os.listdir(tmp_path), key=lambda fileName: -int(fileName.rsplit(".", 1)[1])
+                       if fileName[-1].isdigit() else 0)
+    data = b""
+    for fileName in fileNames:
+        with open(tmp_path / fileName, "rb") as F:
+            fileData = F.read()
+        assert b"\0" not in fileData and (len(fileData) <= 4096 + 64 or fileName == fileNames[-1])
+        data += fileData
+    lines = data.decode().splitlines()
+    assert len(fileNames) > 5 and lines[0] == "before crash" and len(lines) == 501
+    assert lines[-1].endswith("printing line: 499")
@@ -0,0 +1,75 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from fast_logging import Logger, LogInit, ShmQueueConsumer
+
+pytest.importorskip("multiprocessing.shared_memory")
+
+
+def Worker(producer, name, cnt):
+    Logger.setQueue(producer)
+    logger = LogInit(domain=name)
+    for i in range(cnt):
+        logger.info("message %d", i)
+    try:
+        raise ValueError("failed")
+    except ValueError:
+        logger.exception("exception")
+    logger.shutdown()
+
+
+def test_shmqueue(tmp_path):
+    pathName = str(tmp_path / "test_shmqueue.log")
+    ctx = multiprocessing.get_context("spawn")
+    logger = LogInit(pathName=pathName)
+    consumer = ShmQueueConsumer(logger, 4096, mpContext=ctx)
+    workers = [ctx.Process(target=Worker, args=(consumer.producer(), f"worker{n}", 1000)) for n in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    stats = consumer.stats()
+    consumer.stop()
+    logger.shutdown()
+    assert all(worker.exitcode == 0 for worker in workers)
+    assert stats["records"] == 2002 and stats["dropped"] == 0 and stats["used"] == 0
+    with open(pathName) as F:
+        lines = F.read().splitlines()
+    for n in range(2):
+        messages = [line.split(": ", 3)[3] for line in lines if f": worker{n}: " in line]
+        assert messages == [f"message {i}" for i in range(1000)] + ["exception"]
+    assert lines.count("ValueError: failed") == 2
+
+
+class BlockedLogger(object):
+
+    def __init__(self):
+        self.records = []
+        self.evtRelease = threading.Event()
+
+    def logMany(self, records):
+        self.evtRelease.wait()
+        self.records.extend(records)
+
+
+def test_shmqueue_overflow():
+    logger = BlockedLogger()
+    consumer = ShmQueueConsumer(logger, 4096)
+    producer = consumer.producer(block=False, maxBytes=0)
+    producer.put(0.0, "root", 20, "first")
+    while consumer.stats()["used"]:
+        time.sleep(0.001)
+    # The consumer is blocked now.
+    for i in range(500):
+        producer.put(0.0, "root", 20, f"message {i}")
+    assert 0 < producer.dropped < 500 and consumer.stats()["dropped"] == producer.dropped
+    producer = consumer.producer(timeout=0.05, maxBytes=0)
+    producer.put(0.0, "root", 20, "x" * 1000)
+    assert producer.waits == 1 and producer.dropped == 1
+    logger.evtRelease.set()
+    producer.close()
+    consumer.stop()
+    assert len(logger.records) + consumer.stats()["dropped"] == 502
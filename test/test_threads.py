@@ -0,0 +1,45 @@
+import os
+import re
+import threading
+
+from fast_logging import LogInit, FlushPolicy
+
+
+def test_defer_format(tmp_path):
+    pathName = str(tmp_path / "test_defer.log")
+    logger = LogInit(pathName=pathName, useThreads=True, deferFormat="immutable")
+    args = [1, 2]
+    logger.info("immutable %d %s", 1, "x")
+    logger.info("mutable %s", args)
+    args.append(3)
+    logger.shutdown()
+    with open(pathName) as F:
+        lines = F.read().splitlines()
+    assert lines[0].endswith("immutable 1 x")
+    assert lines[1].endswith("mutable [1, 2]")
+    os.remove(pathName)
+
+
+def test_direct_threads(tmp_path):
+    # Many threads write to the double buffer of the log file in the calling threads (no writer thread).
+    pathName = str(tmp_path / "test_direct_threads.log")
+    logger = LogInit(pathName=pathName, maxSize=65536, backupCnt=1000)
+    logger.setFlushPolicy(FlushPolicy(maxBytes=1024))
+
+    def Worker(n):
+        for i in range(500):
+            logger.info("thread %d line %d", n, i)
+
+    threads = [threading.Thread(target=Worker, args=(n,)) for n in range(32)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logger.shutdown()
+    lines = []
+    for fileName in os.listdir(tmp_path):
+        with open(tmp_path / fileName) as F:
+            lines.extend(F.read().splitlines())
+    regex = re.compile(r".*: root: INFO +: thread (\d+) line (\d+)")
+    assert sorted(tuple(map(int, regex.fullmatch(line).groups())) for line in lines) == \
+        [(n, i) for n in range(32) for i in range(500)]